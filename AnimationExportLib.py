@@ -7,21 +7,29 @@
 # Created as part of the Asm4 wb
 
 import os, numpy
+import collections, concurrent.futures, threading
 
 from PySide import QtGui, QtCore
-from PIL import Image, ImageFilter
+from PIL import Image, ImageFilter, GifImagePlugin
 from PIL.ImageQt import ImageQt
 import tempfile
+import shutil, subprocess, struct
 import pathlib
 import cv2
 
 import FreeCADGui as Gui
 import FreeCAD as App
 import Asm4_libs as Asm4
+import Asm4_offscreen
 
 from AnimationLib import animationProvider
 
 
+# render the frames offscreen instead of through image files, set by the OffscreenExport parameter
+def isOffscreen():
+    return App.ParamGet(Asm4.paramPath).GetBool('OffscreenExport', False)
+
+
 """
     +-----------------------------------------------+
     |               Animation Export                |
@@ -36,7 +44,6 @@ class animationExporter():
     def __init__(self, animProvider: animationProvider):
         self.animProvider = animProvider
 
-        self.imageList = None    # list of grabbed animation frames
         self.grabbedView = None  # single grabbed scene used for preview
         self.bgImage = None      # rendered background for compositing
         self.logo = None         # logo for compositing
@@ -52,8 +59,15 @@ class animationExporter():
     #
 
     # grab a single shot from the active scene
+    # it's rendered offscreen if enabled, else through an image file
     @staticmethod
     def getFrame(size=(1024, 768), mod='Current') -> Image.Image:
+        if isOffscreen():
+            try:
+                rgba = Asm4_offscreen.renderView(Gui.ActiveDocument.ActiveView, size, mod)
+                return Image.fromarray(rgba, 'RGBA')
+            except RuntimeError as err:
+                App.Console.PrintWarning(str(err) + ', using the 3D view instead\n')
         tempDir = tempfile.TemporaryDirectory()
         fName = pathlib.Path(tempDir.name) / "temp.png"
         Gui.ActiveDocument.ActiveView.saveImage(str(fName), size[0], size[1], mod)
@@ -117,90 +131,45 @@ class animationExporter():
     # image will not be fully opaque even when a non-transparent object is shown behind a transparent one.
     @staticmethod
     def alphaSanitize(img) -> Image.Image:
-        imgBands = img.split()
-        newAlpha = imgBands[3].point(lambda i: 0 if i == 0 else 255)
-        imgBands[3].paste(newAlpha)
-        img = Image.merge(img.mode, imgBands)
-        return img
+        rgba = numpy.array(img.convert('RGBA'))
+        # 0 stays 0, everything else becomes 255
+        alpha = rgba[:,:,3]
+        numpy.minimum(alpha, 1, out=alpha)
+        alpha *= 255
+        return Image.fromarray(rgba, 'RGBA')
 
 
     #
     # instance bound image acquisition and exporting functions
     #
 
-    # render and grab all frames as per the animation configuration
+    # render and grab the frames as per the animation configuration,
+    # one by one as they are rendered
     def grabFrames(self, size=(1024, 768), mod='Current'):
-        frames = []
         firstFrame = True
         endOfCycle = False
         while not endOfCycle:
             endOfCycle = self.animProvider.nextFrame(firstFrame)
             firstFrame = False
             Gui.updateGui()
-            frame = animationExporter.getFrame(size, mod)
-            frames.append(frame)
-
-        self.imageList = frames
-
-
-    # export all frames to animated gif
-    def writeGif(self, filename):
-        # append reversed list if pendulum is wanted
-        if self.animProvider.pendulumWanted():
-            self.imageList.extend(list(reversed(self.imageList)))
-
-        # Use dithering for all frames
-        for i, img in enumerate(self.imageList):
-            tmp = img.convert(mode='P', palette=Image.ADAPTIVE, colors=256)
-            img = img.convert('RGB')
-            #self.imageList[i] = img.quantize(256, Image.FASTOCTREE, 0, tmp, Image.FLOYDSTEINBERG)
-            self.imageList[i] = tmp
-
-        # export as animated gif
-        loops = self.expDiag.sbOutLoops.value()-1
-        frameMSec = int(1000/self.expDiag.sbOutFPS.value())
-        self.imageList[0].save(filename, save_all=True, append_images=self.imageList[1:], optimize=True, duration=frameMSec, loop=loops)
-
-
-    # export an mp4 from the rendered framed
-    def writeVideo(self, filename):
-        # append reversed list if pendulum is wanted
-        if self.animProvider.pendulumWanted():
-            self.imageList.extend(list(reversed(self.imageList)))
+            yield animationExporter.getFrame(size, mod)
 
-        # Grab the stats from image1 to use for the resultant video
-        height, width, layers = numpy.array(self.imageList[0]).shape
 
-        # create video
+    # the writer for the chosen filename, the format is deduced from its extension
+    def createWriter(self, filename):
         fps = self.expDiag.sbOutFPS.value()
         loops = self.expDiag.sbOutLoops.value()
-        fourccs = ['mp4v', 'avc1', 'X264', 'XVID']
-        # codec = -1  # auto/select
-        exported = False
-        for fcc in fourccs:
-            codec = cv2.VideoWriter_fourcc(*fcc)
-            video = cv2.VideoWriter(filename, codec, fps, (width, height))
-
-            for i in range(0, loops):
-                for img in self.imageList:
-                    img = img.convert('RGB')
-                    video.write(cv2.cvtColor(numpy.array(img), cv2.COLOR_RGB2BGR))
-
-            # write file
-            video.release()
-            if os.path.getsize(filename) > 0:
-                exported = True
-                break
-        if not exported:
-            App.Console.PrintError("Export failed for \"" + filename + "\". Using another container type can help.\n")
-
-    # export each grabbed frame to a separate image
-    def writeFrames(self, filename):
-        # export frame by frame
-        for i, img in enumerate(self.imageList):
-            number = "{:04}".format(i)
-            fname = filename[:-4] + number + filename[-4:]
-            img.save(fname)
+        pendulum = self.animProvider.pendulumWanted()
+        if filename.lower().endswith((".mp4", ".avi", ".mov", ".mkv")):
+            # ffmpeg if it's installed, else OpenCV
+            if ffmpegWriter.codec(filename):
+                return ffmpegWriter(filename, fps, loops, pendulum)
+            return videoWriter(filename, fps, loops, pendulum)
+        elif filename.lower().endswith(".gif"):
+            return gifWriter(filename, fps, loops, pendulum)
+        elif filename.lower().endswith(".png"):
+            return framesWriter(filename, fps, loops, pendulum)
+        return None
 
 
     # alpha composite all precalculated images
@@ -237,42 +206,58 @@ class animationExporter():
 
 
     # the main working function
-    # grabs all the frames as per the current animation configuration
+    # each frame is grabbed, composited and handed to the writer before the next one is grabbed
     def exportAnimation(self):
         # get selected filename, pop up dialog if none selected yet
         fname = self.expDiag.outputFileSel.filename()
         if not fname:
             fname = self.expDiag.outputFileSel.selectFile()
+        writer = self.createWriter(fname)
+        if writer is None:
+            return
 
-        # pop up progress dialog...
+        # pop up progress dialog, the number of frames isn't known in advance
         pDlg = self.createProgressDlg()
-        # ... and grab frames (no progress in the dialog so far, the animation windows slider updates, tho
+        pDlg.setMaximum(0)
         gSize = self.getGrabSize()
         mode = "Transparent" if self.bgImage else "Current"
-        self.grabFrames(gSize, mode)
         rSize = self.getResultSize()
+        compositor = layerCompositor(gSize, rSize, self.bgImage, self.logo, self.shadowParams())
+
+        # the frames are composited in a thread pool while the next ones are grabbed,
+        # and handed to the writer in their order
+        nbThreads = os.cpu_count() or 1
+        pending = collections.deque()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=nbThreads) as pool:
+            for i, img in enumerate(self.grabFrames(gSize, mode)):
+                pending.append( pool.submit(compositor.process, img) )
+                # write the finished frames, and keep at most 2 frames per thread waiting
+                while pending and (pending[0].done() or len(pending) > 2*nbThreads):
+                    writer.addFrame(pending.popleft().result())
+                pDlg.setLabelText("Capturing and Exporting... frame " + str(i+1))
+                if pDlg.wasCanceled():
+                    self.cancelFrames(pending, writer)
+                    return
+            # the last frames
+            while pending:
+                writer.addFrame(pending.popleft().result())
+                QtGui.QApplication.processEvents()
+                if pDlg.wasCanceled():
+                    self.cancelFrames(pending, writer)
+                    return
+
+        # the frames of the pendulum and of the loops are written now
+        writer.close()
+        pDlg.setMaximum(1)
+        pDlg.setValue(pDlg.maximum())
 
-        if pDlg.wasCanceled():
-            return
 
-        # do calculations for all grabbed frames
-        pDlg.setMaximum(len(self.imageList)+5)
-        for i, img in enumerate(self.imageList):
-            img = self.alphaSanitize(img)
-            shadow = self.shadowFromInputFields(img)
-            self.imageList[i] = self.compositStack(rSize, img, shadow)
-            pDlg.setValue(i+1)
-            if pDlg.wasCanceled():
-                return
-
-        # export to the chosen filename, deduce format based in name
-        if fname.lower().endswith((".mp4", ".avi", ".mov", ".mkv")):
-            self.writeVideo(fname)
-        elif fname.lower().endswith(".gif"):
-            self.writeGif(fname)
-        elif fname.lower().endswith(".png"):
-            self.writeFrames(fname)
-        pDlg.setValue(pDlg.maximum())
+    # stop the export: frames not yet composited are dropped
+    def cancelFrames(self, pending, writer):
+        for future in pending:
+            future.cancel()
+        pending.clear()
+        writer.abort()
 
 
     #
@@ -320,12 +305,24 @@ class animationExporter():
 
     # calculate a new shadow layer
     def shadowFromInputFields(self, img):
+        return self.shadowFromParams(img, self.shadowParams())
+
+    # the shadow settings ( color, blur, scale, offset ) of the dialog, or None
+    # read in the GUI thread, and passed to the compositing threads
+    def shadowParams(self):
         useShadow = False # self.expDiag.gpbShadow.isChecked()
         if useShadow:
             color = self.expDiag.shadowColSel.color()
             scale = (self.expDiag.sbShadowWidth.value() / 100.0, self.expDiag.sbShadowHeight.value() / 100.0)
             offset = (self.expDiag.sbShadowX.value() / 100.0, self.expDiag.sbShadowY.value() / 100.0)
             blur = self.expDiag.sbShadowBlur.value()
+            return (color, blur, scale, offset)
+        else:
+            return None
+
+    def shadowFromParams(self, img, params):
+        if params:
+            (color, blur, scale, offset) = params
             return self.createShadow(img, color, blur, scale, offset)
         else:
             return None
@@ -392,7 +389,6 @@ class animationExporter():
 
     def onClose(self):
         self.expDiag.setImage(None)
-        self.imageList = []
 
 
     #
@@ -431,6 +427,504 @@ class animationExporter():
 
 
 
+"""
+    +-----------------------------------------------+
+    |               Layer Compositor                |
+    | Composites the grabbed frames with NumPy, the |
+    | same way as compositStack: background, shadow,|
+    | alpha-cleaned frame and logo, then resizes.   |
+    | The static layers are converted once, and     |
+    | each thread reuses its own buffers.           |
+    +-----------------------------------------------+
+"""
+
+class layerCompositor():
+    def __init__(self, grabSize, outputSize, bgImage=None, logo=None, shadowParams=None):
+        self.grabSize = grabSize
+        self.outputSize = outputSize
+        self.shadowParams = shadowParams
+        self.background = numpy.array(bgImage.convert('RGBA')) if bgImage else None
+        # only the part of the logo that isn't transparent is composited,
+        # it's stored premultiplied: ( r*a, g*a, b*a, a ) in [0,1]
+        self.logo = None
+        box = logo.getbbox() if logo else None
+        if box:
+            self.logoBox = ( slice(box[1], box[3]), slice(box[0], box[2]) )
+            self.logo = self.premultiplied( numpy.asarray(logo.convert('RGBA'))[self.logoBox] )
+        self.local = threading.local()
+
+    # the alpha byte of an RGBA pixel as a 32 bit word
+    opaque = numpy.array([0, 0, 0, 255], dtype=numpy.uint8).view(numpy.uint32)[0]
+
+    @staticmethod
+    def premultiplied(rgba):
+        layer = rgba.astype(numpy.float32) / 255.0
+        layer[:,:,:3] *= layer[:,:,3:4]
+        return layer
+
+    # composite a premultiplied layer over a region of an 8 bit RGBA image, in place
+    @classmethod
+    def over(cls, region, layer):
+        acc = cls.premultiplied(region)
+        acc *= 1.0 - layer[:,:,3:4]
+        acc += layer
+        alpha = acc[:,:,3:4]
+        numpy.divide(acc[:,:,:3], alpha, out=acc[:,:,:3], where=alpha > 0)
+        acc *= 255.0
+        acc += 0.5
+        numpy.clip(acc, 0, 255, out=acc)
+        region[...] = acc
+
+    # the output buffer of the current thread
+    def buffer(self):
+        if not hasattr(self.local, 'out'):
+            (w, h) = self.grabSize
+            self.local.out = numpy.empty( (h, w, 4), dtype=numpy.uint8 )
+        return self.local.out
+
+    # the premultiplied shadow layer at the size of the frame
+    def shadowLayer(self, mask, params):
+        (color, blur, scale, offset) = params
+        (w, h) = self.grabSize
+        alpha = Image.fromarray( mask.astype(numpy.uint8) * numpy.uint8(color[3]), 'L' )
+        shSize = (int(w * scale[0]), int(h * scale[1]))
+        alpha = alpha.resize(shSize, Image.BICUBIC).filter(ImageFilter.GaussianBlur(blur))
+        blurred = numpy.asarray(alpha, dtype=numpy.float32) / 255.0
+        # paste the blurred mask at its offset, clipped to the frame
+        layer = numpy.zeros( (h, w, 4), dtype=numpy.float32 )
+        x, y = int(offset[0] * w), int(offset[1] * h)
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + shSize[0], w), min(y + shSize[1], h)
+        if x1 > x0 and y1 > y0:
+            layer[y0:y1, x0:x1, 3] = blurred[y0-y:y1-y, x0-x:x1-x]
+        layer[:,:,:3] = numpy.array(color[:3], dtype=numpy.float32) / 255.0
+        layer[:,:,:3] *= layer[:,:,3:4]
+        return layer
+
+    # composite a grabbed frame, returns the image at the output size
+    def process(self, img) -> Image.Image:
+        out = self.buffer()
+        frame = numpy.asarray(img if img.mode == 'RGBA' else img.convert('RGBA'))
+        # the alpha threshold: the frame is opaque wherever it isn't fully transparent
+        mask = frame[:,:,3] > 0
+        # background
+        if self.background is not None:
+            numpy.copyto(out, self.background)
+        else:
+            out.fill(0)
+        # shadow
+        if self.shadowParams:
+            self.over( out, self.shadowLayer(mask, self.shadowParams) )
+        # frame, opaque where the mask is set: whole pixels are copied as 32 bit words
+        pixels = numpy.ascontiguousarray(frame).view(numpy.uint32)[:,:,0]
+        numpy.copyto( out.view(numpy.uint32)[:,:,0], pixels | self.opaque, where=mask )
+        # logo
+        if self.logo is not None:
+            self.over( out[self.logoBox], self.logo )
+        # the resized image doesn't share the buffer
+        return Image.fromarray(out, 'RGBA').resize(self.outputSize, Image.BICUBIC)
+
+
+
+"""
+    +-----------------------------------------------+
+    |               Animation Writers               |
+    | Frames are written as soon as they are added. |
+    | The frames needed again for the pendulum or   |
+    | the loops are kept, and replayed by their     |
+    | index when the writer is closed.              |
+    +-----------------------------------------------+
+"""
+
+# the frames kept in memory
+class memorySpool():
+    onDisk = False
+
+    def __init__(self):
+        self.frames = []
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __getitem__(self, i):
+        return self.frames[i]
+
+    def append(self, img):
+        self.frames.append(img)
+
+    def close(self):
+        self.frames = []
+
+
+# the frames appended as raw RGBA to a temporary file, and read back one by one
+# through a memory map: the memory used doesn't depend on the number of frames
+class diskSpool():
+    onDisk = True
+
+    def __init__(self, directory=None):
+        self.file = tempfile.TemporaryFile(dir=directory if directory else None)
+        self.shape = None
+        self.count = 0
+        self.map = None
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        if self.map is None:
+            self.file.flush()
+            self.map = numpy.memmap(self.file, dtype=numpy.uint8, mode='r', shape=(self.count,)+self.shape)
+        return Image.fromarray(numpy.array(self.map[i]), 'RGBA')
+
+    def append(self, img):
+        rgba = numpy.asarray(img.convert('RGBA'))
+        if self.shape is None:
+            self.shape = rgba.shape
+        self.map = None
+        self.file.seek(0, os.SEEK_END)
+        self.file.write(rgba.tobytes())
+        self.count += 1
+
+    def close(self):
+        self.map = None
+        self.file.close()
+
+
+# the spool for the frames of an export, set by the SpoolFrames and SpoolPath parameters
+def createSpool():
+    params = App.ParamGet(Asm4.paramPath)
+    if params.GetBool('SpoolFrames', False):
+        return diskSpool(params.GetString('SpoolPath', ''))
+    return memorySpool()
+
+
+class frameWriter():
+    def __init__(self, filename, fps=10, loops=1, pendulum=False):
+        self.filename = filename
+        self.fps = fps
+        self.loops = loops
+        self.pendulum = pendulum
+        self.frames = createSpool()     # frames kept for the replay
+        self.count = 0                  # number of added frames
+
+    # the frames are written once, by default
+    def needReplay(self):
+        return False
+
+    def addFrame(self, img):
+        self.writeFrame(img)
+        if self.needReplay():
+            self.frames.append(img)
+        self.count += 1
+
+    # the frame indices written after the first pass: the pendulum's way back,
+    # then all the other loops
+    def replayOrder(self):
+        n = len(self.frames)
+        back = range(n-1, -1, -1) if self.pendulum else range(0)
+        yield from back
+        for loop in range(1, self.loops):
+            yield from range(n)
+            yield from back
+
+    def close(self):
+        for i in self.replayOrder():
+            self.writeFrame(self.frames[i])
+        self.frames.close()
+        self.finish()
+
+    # stop without writing the replayed frames
+    def abort(self):
+        self.frames.close()
+        self.finish()
+
+    def writeFrame(self, img):
+        pass
+
+    def finish(self):
+        pass
+
+
+# each frame to a separate image
+class framesWriter(frameWriter):
+    def writeFrame(self, img):
+        number = "{:04}".format(self.count)
+        img.save(self.filename[:-4] + number + self.filename[-4:])
+
+
+# animated gif, the loops are in the header of the gif file
+# all frames share one palette made from a sample of the frames, they are mapped
+# to it in a thread pool, and each frame only stores the rectangle that changed
+# since the previous one, the unchanged pixels in it are transparent
+class gifWriter(frameWriter):
+    paletteSamples = 16      # number of frames used to make the palette
+    sampleWidth = 320        # width of the frames in the sample
+    transparent = 255        # the palette index of the unchanged pixels
+
+    def needReplay(self):
+        return True
+
+    # the frames are all written in close()
+    def addFrame(self, img):
+        self.frames.append( img.convert('RGB') )
+        self.count += 1
+
+    def close(self):
+        if len(self.frames):
+            order = list(range(len(self.frames)))
+            if self.pendulum:
+                order.extend( range(len(self.frames)-1, -1, -1) )
+            self.writeGif(order)
+        self.frames.close()
+
+    # the palette with 255 colors, the last index is left for the transparency
+    def makePalette(self):
+        n = len(self.frames)
+        step = max(1, n // self.paletteSamples)
+        samples = []
+        for i in range(0, n, step):
+            img = self.frames[i].convert('RGB')
+            h = max(1, int(img.size[1] * self.sampleWidth / img.size[0]))
+            samples.append( numpy.asarray(img.resize((self.sampleWidth, h))) )
+        mosaic = Image.fromarray( numpy.concatenate(samples, axis=0), 'RGB' )
+        return mosaic.quantize(colors=255)
+
+    def quantize(self, i, palette):
+        return self.frames[i].convert('RGB').quantize(palette=palette, dither=Image.NONE)
+
+    # the palette images of the frames in order, mapped in a thread pool
+    def quantizedFrames(self, order, palette):
+        nbThreads = os.cpu_count() or 1
+        with concurrent.futures.ThreadPoolExecutor(max_workers=nbThreads) as pool:
+            # the frames are mapped by chunks, to keep only a few of them in memory
+            for start in range(0, len(order), 2*nbThreads):
+                yield from pool.map( lambda i: self.quantize(i, palette), order[start:start+2*nbThreads] )
+
+    def writeGif(self, order):
+        palette = self.makePalette()
+        paletteBytes = bytes( (palette.getpalette()[:768] + [0]*768)[:768] )
+        frameMSec = int(1000/self.fps)
+        size = self.frames[0].size
+        with open(self.filename, 'wb') as file:
+            # header, global palette of 256 colors, and loops
+            file.write( b'GIF89a' + struct.pack('<HHBBB', size[0], size[1], 0xF7, 0, 0) + paletteBytes )
+            file.write( b'!\xff\x0bNETSCAPE2.0\x03\x01' + struct.pack('<H', max(0, self.loops-1)) + b'\x00' )
+            previous = None
+            pending = None
+            for img in self.quantizedFrames(order, palette):
+                index = numpy.asarray(img)
+                if previous is None:
+                    pending = [ img, (0, 0), frameMSec ]
+                else:
+                    changed = index != previous
+                    rows = numpy.nonzero(changed.any(axis=1))[0]
+                    if len(rows) == 0:
+                        # same frame: the previous one is shown longer
+                        pending[2] += frameMSec
+                        continue
+                    cols = numpy.nonzero(changed.any(axis=0))[0]
+                    y0, y1, x0, x1 = rows[0], rows[-1]+1, cols[0], cols[-1]+1
+                    delta = index[y0:y1, x0:x1].copy()
+                    delta[ ~changed[y0:y1, x0:x1] ] = self.transparent
+                    deltaImg = Image.fromarray(delta, 'P')
+                    deltaImg.putpalette(paletteBytes)
+                    self.writeGifFrame(file, *pending)
+                    pending = [ deltaImg, (int(x0), int(y0)), frameMSec ]
+                previous = index
+            self.writeGifFrame(file, *pending)
+            file.write(b';')
+
+    # a frame drawn over the previous ones (disposal 1), with the global palette
+    def writeGifFrame(self, file, img, offset, duration):
+        for data in GifImagePlugin.getdata( img, offset=offset, duration=duration,
+                                            disposal=1, transparency=self.transparent ):
+            file.write(data)
+
+
+# video through OpenCV, the first container type that OpenCV can open is used
+class videoWriter(frameWriter):
+    fourccs = ['mp4v', 'avc1', 'X264', 'XVID']
+
+    def __init__(self, filename, fps=10, loops=1, pendulum=False):
+        super().__init__(filename, fps, loops, pendulum)
+        self.video = None
+        self.opened = False
+
+    def needReplay(self):
+        return self.pendulum or self.loops > 1
+
+    def open(self, size):
+        for fcc in self.fourccs:
+            video = cv2.VideoWriter(self.filename, cv2.VideoWriter_fourcc(*fcc), self.fps, size)
+            if video.isOpened():
+                return video
+            video.release()
+        App.Console.PrintError("Export failed for \"" + self.filename + "\". Using another container type can help.\n")
+        return None
+
+    def writeFrame(self, img):
+        if not self.opened:
+            self.video = self.open(img.size)
+            self.opened = True
+        if self.video:
+            img = img.convert('RGB')
+            self.video.write(cv2.cvtColor(numpy.array(img), cv2.COLOR_RGB2BGR))
+
+    def finish(self):
+        if self.video:
+            self.video.release()
+            self.video = None
+
+
+
+# video through an ffmpeg process, the frames are sent as raw RGB through a pipe
+# the settings are in the Assembly4 parameters: VideoCodec (the ffmpeg encoder),
+# VideoCRF (the quality for x264/x265/vp9, lower is better) and VideoThreads (0 = automatic)
+# only the first loop is encoded, the other loops are copied without encoding
+class ffmpegWriter(frameWriter):
+    encoders = None          # the encoders of the installed ffmpeg, read once
+    defaultCodecs = { '.mp4': ['libx264', 'libopenh264', 'mpeg4'],
+                      '.mov': ['libx264', 'libopenh264', 'mpeg4'],
+                      '.mkv': ['libx264', 'libvpx-vp9', 'mpeg4'],
+                      '.avi': ['mpeg4', 'libx264'] }
+    crfCodecs = ['libx264', 'libx265', 'libvpx-vp9']
+
+    @staticmethod
+    def params():
+        return App.ParamGet(Asm4.paramPath)
+
+    @staticmethod
+    def executable():
+        path = ffmpegWriter.params().GetString('FFmpegPath', '')
+        return path if path else shutil.which('ffmpeg')
+
+    # the names of the encoders supported by ffmpeg
+    @classmethod
+    def supportedEncoders(cls):
+        if cls.encoders is None:
+            cls.encoders = set()
+            exe = cls.executable()
+            if exe:
+                try:
+                    result = subprocess.run( [exe, '-hide_banner', '-encoders'], capture_output=True, text=True, timeout=10 )
+                    for line in result.stdout.splitlines():
+                        fields = line.split()
+                        # encoder lines are: flags name description, the flags start with V for video
+                        if len(fields) > 1 and fields[0].startswith('V') and len(fields[0]) == 6:
+                            cls.encoders.add(fields[1])
+                except (OSError, subprocess.SubprocessError):
+                    pass
+        return cls.encoders
+
+    # the codec to use for a file, or None if ffmpeg can't write it
+    @classmethod
+    def codec(cls, filename):
+        encoders = cls.supportedEncoders()
+        wanted = cls.params().GetString('VideoCodec', '')
+        if wanted:
+            if wanted in encoders:
+                return wanted
+            App.Console.PrintWarning('The video codec "' + wanted + '" is not supported by ffmpeg\n')
+        ext = os.path.splitext(filename)[1].lower()
+        for codec in cls.defaultCodecs.get(ext, []):
+            if codec in encoders:
+                return codec
+        return None
+
+    def __init__(self, filename, fps=10, loops=1, pendulum=False):
+        super().__init__(filename, fps, loops, pendulum)
+        self.process = None
+        self.failed = False
+        self.output = filename
+        self.errors = None
+
+    def needReplay(self):
+        return self.pendulum
+
+    # only the pendulum's way back, the loops are copied
+    def replayOrder(self):
+        if self.pendulum:
+            yield from range(len(self.frames)-1, -1, -1)
+
+    def open(self, size):
+        # the first loop goes to a temporary file if it has to be repeated
+        if self.loops > 1:
+            ext = os.path.splitext(self.filename)[1]
+            (fd, self.output) = tempfile.mkstemp(suffix=ext)
+            os.close(fd)
+        codec = self.codec(self.filename)
+        cmd = [ self.executable(), '-hide_banner', '-loglevel', 'error', '-y',
+                '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', str(size[0])+'x'+str(size[1]),
+                '-r', str(self.fps), '-i', '-',
+                '-c:v', codec, '-threads', str(self.params().GetInt('VideoThreads', 0)),
+                # most players need even dimensions for yuv420p
+                '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2', '-pix_fmt', 'yuv420p' ]
+        if codec in self.crfCodecs:
+            cmd += [ '-crf', str(self.params().GetInt('VideoCRF', 23)) ]
+        if codec == 'libvpx-vp9':
+            cmd += [ '-b:v', '0' ]
+        cmd.append(self.output)
+        # the messages go to a file, a pipe that isn't read while encoding could fill up
+        self.errors = tempfile.TemporaryFile()
+        return subprocess.Popen( cmd, stdin=subprocess.PIPE, stderr=self.errors )
+
+    def writeFrame(self, img):
+        if self.failed:
+            return
+        if self.process is None:
+            self.process = self.open(img.size)
+        try:
+            self.process.stdin.write( img.convert('RGB').tobytes() )
+        except (BrokenPipeError, OSError):
+            self.failed = True
+
+    def finish(self):
+        if self.process is None:
+            return
+        try:
+            self.process.stdin.close()
+        except OSError:
+            self.failed = True
+        self.process.wait()
+        self.errors.seek(0)
+        errors = self.errors.read().decode(errors='replace')
+        self.errors.close()
+        if self.process.returncode != 0 or self.failed:
+            App.Console.PrintError('Export failed for "' + self.filename + '": ' + errors + '\n')
+        elif self.loops > 1:
+            # repeat the first loop without encoding it again
+            cmd = [ self.executable(), '-hide_banner', '-loglevel', 'error', '-y', '-nostdin',
+                    '-stream_loop', str(self.loops-1), '-i', self.output, '-c', 'copy', self.filename ]
+            result = subprocess.run(cmd, stdin=subprocess.DEVNULL, capture_output=True, text=True)
+            if result.returncode != 0:
+                App.Console.PrintError('Export failed for "' + self.filename + '": ' + result.stderr + '\n')
+        self.removeTemporary()
+        self.process = None
+
+    # stop the encoder, and remove what it has written
+    def abort(self):
+        self.frames.close()
+        if self.process is None:
+            return
+        self.process.kill()
+        self.process.wait()
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+        self.errors.close()
+        self.removeTemporary()
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+        self.process = None
+
+    def removeTemporary(self):
+        if self.output != self.filename and os.path.exists(self.output):
+            os.remove(self.output)
+        self.output = self.filename
+
+
+
 """
     +-----------------------------------------------+
     |               Export Dialog UI                |
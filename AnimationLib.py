@@ -106,6 +106,7 @@ class animateVariable(animationProvider):
         self.RunState = self.AnimationState.STOPPED
         self.reverseAnimation = False  # True flags when the animation is "in reverse" for the pendulum mode.
         self.ForceGUIUpdate = False  # True Forces GUI to update on every step of the animation.
+        self.frameCache = frameCache()  # the placements of the already solved steps
         self.timer = QtCore.QTimer()
         self.timer.setInterval(0)
         self.timer.timeout.connect(self.onTimerTick)
@@ -149,9 +150,13 @@ class animateVariable(animationProvider):
         self.updateDocList()
         self.updateVarList()
 
+        # the documents might have changed while the dialog was closed
+        self.frameCache.clear()
         # in case the dialog is newly opened, register for changes of the selected document
+        # and for the edits that make the cached frames stale
         if not self.UI.isVisible():
             self.MDIArea.subWindowActivated.connect(self.onDocChanged)
+            App.addDocumentObserver(self.frameCache)
         self.UI.show()
 
     """
@@ -223,6 +228,7 @@ class animateVariable(animationProvider):
 
     def onSelectVar(self):
         self.update(self.AnimationRequest.STOP)
+        self.frameCache.clear()
         # the currently selected variable
         selectedVar = self.varList.currentText()
         # if it's indeed a property in the Variables object (one never knows)
@@ -341,11 +347,20 @@ class animateVariable(animationProvider):
 
 
     def setVarValue(self,name,value):
-        setattr( self.Variables, name, value )
-        if App.ActiveDocument == self.AnimatedDocument:
-            self.rootAssembly.recompute('True')
-        else:
-            App.ActiveDocument.recompute(None, True, True)
+        self.frameCache.busy = True
+        try:
+            setattr( self.Variables, name, value )
+            # in frame cache mode, each step is only solved once
+            docs = frameCache.documents( App.ActiveDocument, self.AnimatedDocument )
+            if not ( self.CacheFrames.isChecked() and self.frameCache.replay(docs, name, value) ):
+                if App.ActiveDocument == self.AnimatedDocument:
+                    self.rootAssembly.recompute('True')
+                else:
+                    App.ActiveDocument.recompute(None, True, True)
+                if self.CacheFrames.isChecked():
+                    self.frameCache.store(docs, name, value)
+        finally:
+            self.frameCache.busy = False
         self.variableValue.setText('{:.2f}'.format(value))
 
 
@@ -371,6 +386,9 @@ class animateVariable(animationProvider):
     def onForceRender(self):
         self.ForceGUIUpdate = self.ForceRender.isChecked()
 
+    def onCacheFrames(self):
+        self.frameCache.clear()
+
 
     """
     +-----------------------------------------------+
@@ -446,6 +464,8 @@ class animateVariable(animationProvider):
     """
 
     def onRun(self):
+        # the document may have been modified since the last run
+        self.frameCache.clear()
         try:
             self.update(self.AnimationRequest.START)
         except animationProvider.Error as e:
@@ -461,6 +481,7 @@ class animateVariable(animationProvider):
 
     def onClose(self):
         self.onStop()
+        App.removeDocumentObserver(self.frameCache)
         animationHints.cleanUp(self.Variables)
         self.MDIArea.subWindowActivated[QtGui.QMdiSubWindow].disconnect(self.onDocChanged)
         self.UI.close()
@@ -604,9 +625,19 @@ class animateVariable(animationProvider):
         self.Pendulum.setText("Pendulum")
         self.Pendulum.setChecked(False)
 
+        self.CacheFrames = QtGui.QCheckBox()
+        self.CacheFrames.setLayoutDirection(QtCore.Qt.LeftToRight)
+        tt = "Solve each step only once, and replay the stored placements on the next passes and slider moves. "
+        tt += "Only the placements are replayed: don't use it if the variable also changes the shape of parts. "
+        tt += "The stored steps are discarded when the animation is started."
+        self.CacheFrames.setToolTip(tt)
+        self.CacheFrames.setText("Cache frames")
+        self.CacheFrames.setChecked(False)
+
         self.mainLayout.addWidget(self.Loop)
         self.cbLayout = QtGui.QFormLayout()
         self.cbLayout.addRow(self.ForceRender, self.Pendulum)
+        self.cbLayout.addRow(self.CacheFrames)
         self.mainLayout.addLayout(self.cbLayout)
 
         self.mainLayout.addWidget(QtGui.QLabel())
@@ -657,6 +688,7 @@ class animateVariable(animationProvider):
         self.Loop.toggled.connect(                self.onLoop )
         self.Pendulum.toggled.connect(            self.onPendulum )
         self.ForceRender.toggled.connect(self.onForceRender)
+        self.CacheFrames.toggled.connect(self.onCacheFrames)
         self.CloseButton.clicked.connect(         self.onClose )
         self.ExportButton.clicked.connect(self.onExport)
         self.StopButton.clicked.connect(self.onStop)
@@ -815,6 +847,291 @@ class animationHints():
 
 
 
+"""
+    +-----------------------------------------------+
+    |     Frame cache: the placements of each step  |
+    +-----------------------------------------------+
+"""
+
+# the objects whose Placement can change when a variable changes:
+# placed by an Asm4 solver, by an expression, or attached to other objects
+def animatedObjects(doc):
+    objects = []
+    for obj in doc.Objects:
+        if not hasattr(obj, 'Placement'):
+            continue
+        if hasattr(obj, 'AttachedTo') and obj.AttachedTo:
+            objects.append(obj)
+        elif any( path.startswith('Placement') or path.startswith('.Placement') for (path, expr) in obj.ExpressionEngine ):
+            objects.append(obj)
+        elif hasattr(obj, 'MapMode') and obj.MapMode != 'Deactivated':
+            objects.append(obj)
+    return objects
+
+
+# the Placements are stored for all the documents which are recomputed:
+# the active document, and the document of the variables if it's another one
+# the cache is also a document observer: any change in these documents
+# which isn't made by the animation itself clears it
+class frameCache():
+    def __init__(self):
+        self.busy = False       # True while the animation sets the variables and solves
+        self.clear()
+
+    def clear(self):
+        self.docNames = ()
+        self.names = []         # the ( docName, objName ) of the animated objects
+        self.frames = {}        # ( varName, value ) -> Placements array, one row [x,y,z,q0,q1,q2,q3] per object
+        self.current = None     # the Placements array currently in the documents
+
+    @staticmethod
+    def key(varName, value):
+        return ( varName, round(value, 9) )
+
+    # the documents recomputed by the animation, without duplicates
+    @staticmethod
+    def documents(*docs):
+        result = []
+        for doc in docs:
+            if doc is not None and doc not in result:
+                result.append(doc)
+        return result
+
+    def getObject(self, i):
+        (docName, objName) = self.names[i]
+        doc = App.listDocuments().get(docName)
+        return doc.getObject(objName) if doc else None
+
+    # the Placements of all animated objects, as an array
+    def getPlacements(self):
+        frame = numpy.empty( (len(self.names), 7) )
+        for i in range(len(self.names)):
+            plc = self.getObject(i).Placement
+            frame[i,0:3] = tuple(plc.Base)
+            frame[i,3:7] = plc.Rotation.Q
+        return frame
+
+    # store the Placements of the current, solved, step
+    def store(self, docs, varName, value):
+        docNames = tuple( doc.Name for doc in docs )
+        if docNames != self.docNames:
+            self.clear()
+            self.docNames = docNames
+            self.names = [ (doc.Name, obj.Name) for doc in docs for obj in animatedObjects(doc) ]
+        self.current = self.getPlacements()
+        self.frames[ self.key(varName, value) ] = self.current
+
+    # set the stored Placements of a step, only those which differ from the current ones
+    # returns False if the step is not in the cache
+    def replay(self, docs, varName, value):
+        frame = self.frames.get( self.key(varName, value) )
+        if frame is None or tuple( doc.Name for doc in docs ) != self.docNames:
+            return False
+        if self.current is None:
+            changed = range(len(self.names))
+        else:
+            changed = numpy.nonzero( numpy.any(frame != self.current, axis=1) )[0]
+        for i in changed:
+            obj = self.getObject(i)
+            if obj is None:
+                # the document has changed, start again
+                self.clear()
+                return False
+            obj.Placement = App.Placement( App.Vector(*frame[i,0:3]), App.Rotation(*frame[i,3:7]) )
+        self.current = frame
+        return True
+
+    # document observer API
+    def slotChangedObject(self, obj, prop):
+        if not self.busy and self.frames and obj.Document.Name in self.docNames:
+            self.clear()
+
+    def slotDeletedObject(self, obj):
+        if not self.busy and self.frames and obj.Document.Name in self.docNames:
+            self.clear()
+
+    def slotDeletedDocument(self, doc):
+        if doc.Name in self.docNames:
+            self.clear()
+
+    def slotUndoDocument(self, doc):
+        if doc.Name in self.docNames:
+            self.clear()
+
+    def slotRedoDocument(self, doc):
+        if doc.Name in self.docNames:
+            self.clear()
+
+
+
+
+"""
+    +-----------------------------------------------+
+    |     Keyframe animation of several variables   |
+    +-----------------------------------------------+
+"""
+
+# the second derivatives of the natural cubic spline through the points (t, y)
+def splineSecondDerivatives(t, y):
+    n = len(t)
+    M = numpy.zeros(n)
+    if n < 3:
+        return M
+    h = numpy.diff(t)
+    A = numpy.zeros( (n, n) )
+    A[0,0] = A[-1,-1] = 1.0
+    i = numpy.arange(1, n-1)
+    A[i, i-1] = h[:-1]
+    A[i, i]   = 2.0 * (h[:-1] + h[1:])
+    A[i, i+1] = h[1:]
+    rhs = numpy.zeros(n)
+    slopes = numpy.diff(y) / h
+    rhs[1:-1] = 6.0 * numpy.diff(slopes)
+    return numpy.linalg.solve(A, rhs)
+
+
+# the values at the times x of the curve through the keyframes (t, y)
+# before the first and after the last keyframe the values are held
+def interpolate(t, y, x, mode='linear'):
+    t = numpy.asarray(t, dtype=float)
+    y = numpy.asarray(y, dtype=float)
+    x = numpy.clip( numpy.asarray(x, dtype=float), t[0], t[-1] )
+    if mode != 'spline' or len(t) < 3:
+        return numpy.interp(x, t, y)
+    M = splineSecondDerivatives(t, y)
+    i = numpy.clip( numpy.searchsorted(t, x, side='right')-1, 0, len(t)-2 )
+    h = t[i+1] - t[i]
+    a = (t[i+1] - x) / h
+    b = (x - t[i]) / h
+    return a*y[i] + b*y[i+1] + ( (a**3-a)*M[i] + (b**3-b)*M[i+1] ) * h*h / 6.0
+
+
+# an animation of several variables of the Variables object at once
+# keyframes is a dict { varName: [ (time, value), ... ] }, times are in seconds
+# interpolation is 'linear' or 'spline' (natural cubic spline through the keyframes)
+# all frames are calculated when the animation is created, and set one by one by nextFrame,
+# it can be played with play() or exported with AnimationExportLib.animationExporter:
+#
+# anim = AnimationLib.keyframeAnimation( App.ActiveDocument.Variables,
+#            { 'Angle': [(0,0), (1,90), (2,0)], 'Height': [(0,0), (2,50)] }, fps=25, interpolation='spline' )
+# anim.play()
+class keyframeAnimation(animationProvider):
+    def __init__(self, variables, keyframes, fps=25, interpolation='linear', pendulum=False, cacheFrames=False):
+        super(keyframeAnimation,self).__init__()
+        self.Variables = variables
+        self.fps = fps
+        self.interpolation = interpolation
+        self.pendulum = pendulum
+        self.varNames = []
+        self.keyframes = {}
+        for varName, keys in keyframes.items():
+            if varName not in variables.PropertiesList:
+                raise animateVariable.variableInvalidError(varName)
+            # keyframes with the same time are merged, the last one given wins,
+            # the interpolation needs strictly increasing times
+            keys = dict( (float(t), v) for (t, v) in keys )
+            if len(keys) > 0:
+                self.varNames.append(varName)
+                self.keyframes[varName] = sorted(keys.items())
+        self.evaluate()
+        self.frameIndex = 0
+        self.frameCache = frameCache() if cacheFrames else None
+        self.timer = None
+
+    # calculate the values of all variables for all frames, as an array (nbFrames, nbVariables)
+    def evaluate(self):
+        times = [ t for keys in self.keyframes.values() for (t, v) in keys ]
+        if times:
+            start, end = min(times), max(times)
+        else:
+            start, end = 0.0, 0.0
+        nbFrames = int(round( (end-start) * self.fps )) + 1
+        self.times = numpy.linspace(start, end, nbFrames)
+        self.values = numpy.empty( (nbFrames, len(self.varNames)) )
+        for j, varName in enumerate(self.varNames):
+            keys = numpy.array(self.keyframes[varName], dtype=float)
+            self.values[:,j] = interpolate( keys[:,0], keys[:,1], self.times, self.interpolation )
+        return self.values
+
+    def nbFrames(self):
+        return len(self.times)
+
+    # set all variables of a frame, and recompute once
+    def setFrame(self, index):
+        if self.frameCache:
+            self.frameCache.busy = True
+        try:
+            for varName, value in zip(self.varNames, self.values[index]):
+                setattr( self.Variables, varName, float(value) )
+            doc = App.ActiveDocument
+            docs = frameCache.documents( doc, self.Variables.Document )
+            if self.frameCache and self.frameCache.replay(docs, '', index):
+                return
+            if doc == self.Variables.Document:
+                Asm4.getAssembly().recompute('True')
+            else:
+                doc.recompute(None, True, True)
+            if self.frameCache:
+                self.frameCache.store(docs, '', index)
+        finally:
+            if self.frameCache:
+                self.frameCache.busy = False
+
+    #
+    # animationProvider Interface
+    #
+    def nextFrame(self, resetAnimation) -> bool:
+        if resetAnimation:
+            self.frameIndex = 0
+        else:
+            self.frameIndex = min(self.frameIndex+1, self.nbFrames()-1)
+        self.setFrame(self.frameIndex)
+        return self.frameIndex == self.nbFrames()-1
+
+    def pendulumWanted(self) -> bool:
+        return self.pendulum
+
+    # play the animation in the 3D view, forth and back in pendulum mode
+    def play(self, loop=False):
+        self.stop()
+        self.loop = loop
+        self.reverse = False
+        # while playing, changes to the documents clear the cache
+        if self.frameCache:
+            App.addDocumentObserver(self.frameCache)
+        self.nextFrame(True)
+        self.timer = QtCore.QTimer()
+        self.timer.setInterval( int(1000/self.fps) )
+        self.timer.timeout.connect(self.onTimerTick)
+        self.timer.start()
+
+    def stop(self):
+        if self.timer:
+            self.timer.stop()
+            self.timer = None
+            if self.frameCache:
+                App.removeDocumentObserver(self.frameCache)
+
+    def onTimerTick(self):
+        if self.reverse:
+            self.frameIndex = max(self.frameIndex-1, 0)
+            self.setFrame(self.frameIndex)
+            if self.frameIndex == 0:
+                self.reverse = False
+                if not self.loop:
+                    self.stop()
+        elif self.nextFrame(False):
+            if self.pendulum:
+                self.reverse = True
+            elif self.loop:
+                # the next tick starts again with the first frame
+                self.frameIndex = -1
+            else:
+                self.stop()
+        Gui.updateGui()
+
+
+
 """
     +-----------------------------------------------+
     |       add the command to the workbench        |
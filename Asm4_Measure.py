@@ -42,6 +42,8 @@ import Part
 # only needed for icons
 import Asm4_libs as Asm4
 import selectionFilter
+import Asm4_spatial
+import Asm4_measureBatch
 
 
 
@@ -51,12 +53,13 @@ import selectionFilter
     |                Global variables               |
     +-----------------------------------------------+
 """
-global taskUI, addedDims, PtS, Asm4_3DselObserver
-addedDims = []
+global taskUI, PtS, Asm4_3DselObserver
 PtS = None
 
 
 annoFontSize = 12.0
+# delay in ms before the snap point under the mouse is shown
+preSnapDelay = 300
 annoPrecision = 0.001
 iconDir = Asm4.iconPath
 
@@ -64,23 +67,164 @@ iconDir = Asm4.iconPath
 # remove previous snap point
 def removePtS():
     global PtS
-    if PtS and hasattr(PtS,'Name') and App.ActiveDocument.getObject(PtS.Name):
-        App.ActiveDocument.removeObject(PtS.Name)
-        PtS = None
+    overlay.setSnap(None)
+    PtS = None
 
 
-# usage:
-# object = App.ActiveDocument.addObject('App::FeaturePython','objName')
-# object.ViewObject.Proxy = setCustomIcon(object,'Icon.svg')
-# import base64
-# encoded = base64.b64encode(open("filename.png", "rb").read())
-class setCustomIcon():
-    def __init__( self, obj, iconFile ):
-        icon = os.path.join( iconDir , iconFile )
-        self.customIcon = icon
 
-    def getIcon(self):
-        return self.customIcon
+"""
+    +-----------------------------------------------+
+    |        the overlay of the measurements        |
+    +-----------------------------------------------+
+"""
+# all the measurements are drawn in a single Coin node in the 3D view, and not
+# as document objects: measuring doesn't recompute the document and doesn't
+# add to the undo stack. The lines of each width are batched in one coordinate
+# node, and so are all the points
+class measureOverlay():
+    lineColor  = ( 1.0, 1.0, 1.0 )
+    pointColor = ( 0.0, 0.0, 1.0 )
+    snapColor  = ( 1.000, 0.667, 0.000 )
+    textColor  = ( 1.0, 1.0, 1.0 )
+    pointSize  = 10
+    hoverSize  = 6
+
+    def __init__(self):
+        self.root = None
+        self.docName = None
+        self.sceneGraph = None
+        self.clearData()
+
+    def clearData(self):
+        # width -> ( [ points ], [ number of points of each line ] )
+        self.lines = {}
+        self.points = []
+        self.snap = None
+        self.hover = None
+
+    # the root node, in the 3D view of the active document
+    def attach(self):
+        guiDoc = Gui.ActiveDocument
+        if guiDoc is None:
+            return None
+        if self.root is not None and self.docName == guiDoc.Document.Name:
+            return self.root
+        self.clear()
+        # drawn over the shapes, without lights
+        self.root = coin.SoAnnotation()
+        lightModel = coin.SoLightModel()
+        lightModel.model = coin.SoLightModel.BASE_COLOR
+        self.root.addChild(lightModel)
+        self.lineNodes  = coin.SoSeparator()
+        self.pointNodes = coin.SoSeparator()
+        self.textNodes  = coin.SoSeparator()
+        self.root.addChild(self.lineNodes)
+        self.root.addChild(self.pointNodes)
+        self.root.addChild(self.textNodes)
+        self.sceneGraph = guiDoc.ActiveView.getSceneGraph()
+        self.sceneGraph.addChild(self.root)
+        self.docName = guiDoc.Document.Name
+        return self.root
+
+    # remove all the measurements from the 3D view
+    def clear(self):
+        if self.root is not None:
+            try:
+                self.sceneGraph.removeChild(self.root)
+            except Exception:
+                # the view has been closed
+                pass
+        self.root = None
+        self.docName = None
+        self.sceneGraph = None
+        self.clearData()
+
+    # a polyline through the points
+    def addLine(self, points, width=3):
+        if self.attach() is None or len(points) < 2:
+            return
+        (coords, counts) = self.lines.setdefault( width, ( [], [] ) )
+        coords.extend( [ (p.x, p.y, p.z) for p in points ] )
+        counts.append( len(points) )
+        self.updateLines()
+
+    def addPoint(self, point):
+        if self.attach() is None:
+            return
+        self.points.append( (point.x, point.y, point.z) )
+        self.updatePoints()
+
+    # the snap point of the selection, and the point snapped under the mouse
+    def setSnap(self, point):
+        if point is not None:
+            self.attach()
+        self.snap = (point.x, point.y, point.z) if point is not None else None
+        if self.root is not None:
+            self.updatePoints()
+
+    def setHover(self, point):
+        if point is not None:
+            self.attach()
+        self.hover = (point.x, point.y, point.z) if point is not None else None
+        if self.root is not None:
+            self.updatePoints()
+
+    # a label with one line for each string of the table
+    def addText(self, position, textTable):
+        if self.attach() is None:
+            return
+        node = coin.SoSeparator()
+        move = coin.SoTranslation()
+        move.translation.setValue( position.x, position.y, position.z )
+        color = coin.SoBaseColor()
+        color.rgb = self.textColor
+        font = coin.SoFont()
+        font.size = annoFontSize
+        text = coin.SoText2()
+        text.string.setValues( 0, len(textTable), [ str(t) for t in textTable ] )
+        for child in ( move, color, font, text ):
+            node.addChild(child)
+        self.textNodes.addChild(node)
+
+    def updateLines(self):
+        self.lineNodes.removeAllChildren()
+        for width, (coords, counts) in self.lines.items():
+            node = coin.SoSeparator()
+            style = coin.SoDrawStyle()
+            style.lineWidth = width
+            color = coin.SoBaseColor()
+            color.rgb = self.lineColor
+            points = coin.SoCoordinate3()
+            points.point.setValues( 0, len(coords), coords )
+            lines = coin.SoLineSet()
+            lines.numVertices.setValues( 0, len(counts), counts )
+            for child in ( style, color, points, lines ):
+                node.addChild(child)
+            self.lineNodes.addChild(node)
+
+    def updatePoints(self):
+        self.pointNodes.removeAllChildren()
+        groups = [ ( self.points, self.pointColor, self.pointSize ) ]
+        if self.snap is not None:
+            groups.append( ( [self.snap], self.snapColor, self.pointSize ) )
+        if self.hover is not None:
+            groups.append( ( [self.hover], self.snapColor, self.hoverSize ) )
+        for (coords, rgb, size) in groups:
+            if not coords:
+                continue
+            node = coin.SoSeparator()
+            style = coin.SoDrawStyle()
+            style.pointSize = size
+            color = coin.SoBaseColor()
+            color.rgb = rgb
+            points = coin.SoCoordinate3()
+            points.point.setValues( 0, len(coords), coords )
+            for child in ( style, color, points, coin.SoPointSet() ):
+                node.addChild(child)
+            self.pointNodes.addChild(node)
+
+
+overlay = measureOverlay()
 
 
 """
@@ -134,7 +278,6 @@ class MeasureUI():
         global taskUI
         taskUI = self
         global PtS
-        global addedDims
 
         # start the observer
         Gui.Selection.clearSelection()
@@ -158,9 +301,8 @@ class MeasureUI():
                     | QtGui.QDialogButtonBox.Ok )
 
     # OK button
+    # the measurements stay in the 3D view until the next Reset
     def accept(self):
-        # update the Measure group to get rid if the small overlay icon
-        App.ActiveDocument.recompute()
         self.Finish()
 
     # Cancel button
@@ -178,32 +320,24 @@ class MeasureUI():
         FCC.PrintMessage("closing ... ")
         try:
             Gui.Selection.removeObserver(self.so)   # uninstall the resident SelObserver function
+            self.so.preSnapTimer.stop()
             FCC.PrintMessage("done\n")
         except:
             FCC.PrintWarning("was not able to remove observer\n")
         # remove PtS because it can have strange results
         removePtS()
+        overlay.setHover(None)
         # close Task widget
         Gui.Control.closeDialog()
 
     # Reset (clear measures)
     def Reset(self):
-        global PtS, addedDims
+        global PtS
         Gui.Selection.clearSelection()
         self.clearConsole()
         FCC.PrintMessage('Removing all measurements ...')
         removePtS()
-        for d in addedDims:
-            FCC.PrintMessage('.')
-            try:
-                App.ActiveDocument.removeObject(d.Name)
-            except:
-                pass
-        addedDims=[]
-        # also remove the "Measures" group if any
-        if App.ActiveDocument.getObject('Measures') and \
-                    App.ActiveDocument.getObject('Measures').TypeId=='App::DocumentObjectGroup':
-            App.ActiveDocument.removeObject('Measures')
+        overlay.clear()
         # clear UI
         self.sel1Name.clear()
         self.sel2Name.clear()
@@ -279,11 +413,6 @@ class MeasureUI():
         self.validIcon     = QtGui.QIcon(pm)
         pm.loadFromData(base64.b64decode(    select_b64        ))
         self.selectIcon    = QtGui.QIcon(pm)
-        # icons for the tree
-        self.pointIcon     = 'Draft_Point.svg'
-        self.lineIcon      = 'Draft_Line.svg'
-        self.circleIcon    = 'Draft_Circle.svg'
-        self.dimensionIcon = 'Draft_Dimension.svg'
 
         # the layout for the main window is vertical (top to down)
         self.mainLayout = QtGui.QVBoxLayout(self.form)
@@ -528,6 +657,12 @@ class selectionObserver():
         self.Shp2 = None
         self.Pt2  = None
         PtS       = None
+        # the pre-snap is computed when the mouse rests on a shape,
+        # not for each shape it passes over
+        self.preSnapTimer = QtCore.QTimer()
+        self.preSnapTimer.setSingleShot(True)
+        self.preSnapTimer.setInterval(preSnapDelay)
+        self.preSnapTimer.timeout.connect(self.preSnap)
 
     def render_distance(self, distance: float) -> str:
         return App.Units.schemaTranslate(
@@ -535,25 +670,6 @@ class selectionObserver():
             App.Units.getSchema(),
         )[0]
 
-    # add the dim to the global addedDims table to be able to remove it
-    # add it also the "Measures" group
-    def addToDims( self, dim ):
-        global addedDims
-        # check whether there is a "Measures" group
-        if not App.ActiveDocument.getObject('Measures'):
-            # if no, create one
-            measuresGroup = App.ActiveDocument.addObject( 'App::DocumentObjectGroup', 'Measures' )
-        # if there is already one, use it
-        elif App.ActiveDocument.getObject('Measures').TypeId=='App::DocumentObjectGroup':
-            measuresGroup = App.ActiveDocument.getObject('Measures')
-        # there is already a "Measures" object but it's not a Group, don't use it
-        else:
-            measuresGroup = None
-        if measuresGroup:
-            measuresGroup.addObject(dim)
-        # finally, add the dim to the global addedDims table/list
-        addedDims.append(dim)
-
     # the real function
     def addSelection(self, document, obj, element, position):
         global taskUI
@@ -569,6 +685,10 @@ class selectionObserver():
         selEx = Gui.Selection.getSelectionEx('', 0)
         if len(Gui.Selection.getSelection()) == 1 or len(selEx) == 1:# or (len(selobject) == 1 and len(sel) == 1):
             selObj = Gui.Selection.getSelection()[0]
+            # the point clicked in the 3D view, none if selected in the tree
+            picked = None
+            if len(selEx[0].PickedPoints)>0:
+                picked = selEx[0].PickedPoints[0]
             #Faces or Edges
             if len(selEx[0].SubObjects)>0:
                 subShape = selEx[0].SubObjects[0]
@@ -576,9 +696,9 @@ class selectionObserver():
                 if selObj.TypeId == 'PartDesign::CoordinateSystem':
                     base = selObj.Placement.Base
                     PtS  = self.drawPoint( App.Vector(base.x,base.y,base.z) )
-                    subShape = PtS.Shape
+                    subShape = Part.Vertex(Part.Point( PtS ))
                 # if valid selection
-                if subShape.isValid() and ('Face' in str(subShape) or 'Edge' in str(subShape) or 'Vertex' in str(subShape)):
+                if subShape.isValid() and subShape.ShapeType in ('Face','Edge','Vertex'):
                     # clear the result area
                     taskUI.resultText.clear()
                     removePtS()
@@ -593,11 +713,11 @@ class selectionObserver():
                         self.Shp2 = None
                         self.Pt2  = None
                         #taskUI.sel1Name.setText(str(subShape))
-                        taskUI.sel1Name.setText(str(subShape).split(' ')[0][1:])
+                        taskUI.sel1Name.setText(subShape.ShapeType)
                         taskUI.sel2Name.clear()                        # shape selected
                         if taskUI.rbShape.isChecked():
                             # the shape is actually a vertex, thus a point
-                            if 'Vertex' in str(subShape):
+                            if subShape.ShapeType == 'Vertex':
                                 self.Pt1 = subShape.Vertexes[0].Point
                                 PtS  = self.drawPoint(self.Pt1)
                                 self.Sel1 = 'point'
@@ -607,7 +727,7 @@ class selectionObserver():
                                 self.Sel1 = 'shape'
                         # Snap to select a point
                         elif taskUI.rbSnap.isChecked():
-                            self.Pt1 = self.getSnap(subShape)
+                            self.Pt1 = self.getSnap(subShape, picked)
                             if self.Pt1:
                                 PtS  = self.drawPoint(self.Pt1)
                                 self.Sel1 = 'point'
@@ -619,10 +739,10 @@ class selectionObserver():
                             # if we have selected a shape before, we show its characteristics
                             elif self.Sel1 == 'shape':
                                 # a surface
-                                if 'Face' in str(self.Shp1):
+                                if self.Shp1.ShapeType == 'Face':
                                     self.measureArea(self.Shp1)
                                 # a point (should have been caught before)
-                                elif 'Vertex' in str(self.Shp1):
+                                elif self.Shp1.ShapeType == 'Vertex':
                                     self.measureCoords( self.Shp1 )
                                 # a circle or arc of circle
                                 # elif hasattr(self.Shp1,'Curve') and hasattr(self.Shp1.Curve,'Radius'):
@@ -656,13 +776,13 @@ class selectionObserver():
                         #    App.ActiveDocument.removeObject(PtS.Name)
                         #    PtS = None
                         # figure out the second selected element
-                        taskUI.sel2Name.setText(str(subShape).split(' ')[0][1:])
+                        taskUI.sel2Name.setText(subShape.ShapeType)
                         if taskUI.rbShape.isChecked():
                             self.Sel2 = 'shape'
                             self.Shp2 = subShape
                         # Snap to select a point
                         elif taskUI.rbSnap.isChecked():
-                            self.Pt2 = self.getSnap(subShape)
+                            self.Pt2 = self.getSnap(subShape, picked)
                             if self.Pt2:
                                 self.Sel2 = 'point'
                         # if we have a valid selection:
@@ -700,6 +820,39 @@ class selectionObserver():
                     self.printResult('ERROR 40\n'+str(subShape))
 
 
+    # pre-snap the shape under the mouse: this builds its spatial index
+    # before it is clicked, and shows the snap point in the status bar
+    def setPreselection(self, document, obj, element):
+        global taskUI
+        if element and taskUI.rbSnap.isChecked():
+            self.preSnapTimer.start()
+
+    def removePreselection(self, document, obj, element):
+        self.preSnapTimer.stop()
+        overlay.setHover(None)
+
+    def preSnap(self):
+        global taskUI
+        if not taskUI.rbSnap.isChecked():
+            return
+        # the mouse may have left the shape, or it has no sub-shape
+        presel = Gui.Selection.getPreselection()
+        if presel is None or len(presel.SubObjects)==0:
+            return
+        shape = presel.SubObjects[0]
+        picked = presel.PickedPoints[0] if len(presel.PickedPoints)>0 else None
+        if not shape.isValid() or shape.ShapeType not in ('Face','Edge','Vertex'):
+            return
+        try:
+            point = self.getSnap(shape, picked)
+        except Exception as err:
+            FCC.PrintWarning('Pre-snap failed for '+presel.ObjectName+' : '+str(err)+'\n')
+            return
+        overlay.setHover(point)
+        if point:
+            Gui.getMainWindow().statusBar().showMessage( 'Snap : ( '+self.arrondi(point.x)+', '
+                                +self.arrondi(point.y)+', '+self.arrondi(point.z)+' )' )
+
     # uses BRepExtrema_DistShapeShape to calculate the distance between 2 shapes
     def angleShapes( self, shape1, shape2 ):
         global taskUI
@@ -716,26 +869,13 @@ class selectionObserver():
                 pt2 = shape2.Placement.Base
             else:
                 pt2 = shape2.BoundBox.Center
-            # get the direction of the shape
-            dir1 = self.getDir(shape1)
-            dir2 = self.getDir(shape2)
-            if dir1 and dir2:
+            # the angle between the directions of the shapes
+            angle = Asm4_measureBatch.shapeAngle(shape1, shape2)
+            if angle is not None:
                 distance = -1
-                angle = dir1.getAngle(dir2)*180./math.pi
-                # 2 flat faces
-                if self.isFlatFace(shape1) and self.isFlatFace(shape2):
-                    angle = 180 - angle
-                else:
-                    # 1 flat face and 1 direction
-                    if self.isFlatFace(shape1) or self.isFlatFace(shape2):
-                        angle = 90 - angle
-                    if angle > 90:
-                        angle = 180. - angle
                 # parallel directions
                 if abs(angle) < 1.0e-6 or abs(180-angle)<1.0e-6:
-                    v1 = Part.Vertex(Part.Point( pt1 ))
-                    v2 = Part.Vertex(Part.Point( pt2 ))
-                    distance = v1.distToShape(v2)[0]
+                    distance = pt1.distanceToPoint(pt2)
                 self.printAngle( angle, distance )
                 try:
                     self.drawLine(pt1,pt2,'Angle')
@@ -747,18 +887,16 @@ class selectionObserver():
         else:
             self.printResult('Ivalid shapes')
 
-    # uses BRepExtrema_DistShapeShape to calculate the distance between 2 shapes
+    # the spatial index finds the closest faces/edges/vertices of the 2 shapes,
+    # then BRepExtrema_DistShapeShape calculates the exact distance between them
     def distShapes( self, shape1, shape2 ):
         global taskUI
         if shape1.isValid() and shape2.isValid():
             Gui.Selection.clearSelection()
-            measure = shape1.distToShape(shape2)
-            if measure and self.isVector(measure[1][0][0]) and self.isVector(measure[1][0][1]):
-                dist = measure[0]
+            (dist, pt1, pt2) = Asm4_spatial.shapeDistance( shape1, shape2 )
+            if self.isVector(pt1) and self.isVector(pt2):
                 self.printResult('Minimum Distance :\n  '+str(dist))
                 if dist > 1.0e-9:
-                    pt1   = measure[1][0][0]
-                    pt2   = measure[1][0][1]
                     self.measurePoints(pt1,pt2)
         else:
             self.printResult('Ivalid shapes')
@@ -846,43 +984,21 @@ class selectionObserver():
             self.printResult('Not a valid circle\n'+str(circle))
 
 
-    # figure out the direction of a shape, be it a line, a surface or a circle
-    def getDir( self, shape ):
-        direction = None
-        # for a segment, it's the normalized vector along the segment
-        if self.isSegment(shape):
-            line = shape
-            pt1 = line.Vertexes[0].Point
-            pt2 = line.Vertexes[1].Point
-            vect = (pt2.sub(pt1))
-            if vect.Length != 0:
-                direction = vect / vect.Length
-        # for another line (like Datum::Line) it's the Z vector
-        # multiplied by the Line's Placement
-        elif self.isLine(shape):
-            direction = shape.Placement.Rotation.multVec(App.Vector(0,0,1))
-        # for a Circle it's the circle's axis
-        elif self.isCircle(shape):
-            direction = shape.Curve.Axis
-            # TODO: drawAxis(circle)
-        # for a flt face it's the normal
-        elif self.isFlatFace(shape):
-            direction = shape.normalAt(0,0)
-            # TODO: drawNormal(face)
-        return direction
-
     # figure out snap point of shape
-    def getSnap( self, shape ):
+    # if the shape was clicked in the 3D view, snap to its vertex, middle of edge
+    # or center nearest to the clicked point
+    def getSnap( self, shape, picked=None ):
         point = None
         if shape.isValid():
-            if 'Vertex' in str(shape):
+            if shape.ShapeType == 'Vertex':
                 point  = shape.Vertexes[0].Point
             # for a circle, snap to the center
-            elif 'Edge' in str(shape) and hasattr(shape,'Curve') \
-                                      and hasattr(shape.Curve,'Radius'):
+            elif shape.ShapeType == 'Edge' and self.isCircle(shape):
                 point = shape.Curve.Center
+            elif picked is not None and shape.BoundBox.DiagonalLength < Asm4_spatial.infiniteSize:
+                point = Asm4_spatial.snapPoint( shape, picked )[0]
             # as fall-back, snap to center of bounding box
-            elif hasattr(shape,'BoundBox'):
+            if point is None and hasattr(shape,'BoundBox'):
                 point = shape.BoundBox.Center
         else:
             self.printResult('Invalid shape\n'+str(shape))
@@ -941,93 +1057,35 @@ class selectionObserver():
         taskUI.resultText.clear()
         taskUI.resultText.setPlainText(text)
 
+    # textTable is a table if strings: [ 'toto', 'titi', 'tata' ]
     def drawAnnotation(self, pos, textTable ):
-        anno = App.ActiveDocument.addObject("App::AnnotationLabel","MeasureLbl")
-        anno.BasePosition = pos
-        # textTable is a table if strings: [ 'toto', 'titi', 'tata' ]
-        anno.LabelText = textTable
-        annoG = Gui.ActiveDocument.getObject(anno.Name)
-        annoG.FontSize = annoFontSize
-        self.addToDims(anno)
+        overlay.addText( pos, textTable )
 
     def drawCircle( self, radius, center, axis ):
-        global taskUI
         cc = Part.makeCircle( radius, center, axis )
-        circle = App.ActiveDocument.addObject('Part::FeaturePython', 'aCircle')
-        #circle.ViewObject.Proxy = setCustomIcon(circle,'Draft_Circle.svg')
-        circle.ViewObject.Proxy = setCustomIcon( circle, taskUI.circleIcon )
-        circle.Shape = Part.Wire( cc )
-        circle.ViewObject.LineWidth = 5
-        circle.ViewObject.LineColor = ( 1.0, 1.0, 1.0 )
-        circle.ViewObject.PointSize = 10
-        circle.ViewObject.PointColor= ( 0.0, 0.0, 1.0 )
-        self.addToDims(circle)
+        overlay.addLine( cc.discretize(Deflection=radius*0.002), width=5 )
 
     def drawDim( self, pt1, pt2, name='aDim', width=2 ):
-        global taskUI
         if pt1!=pt2:
-            # unit direction vector
-            vDir = App.Vector(pt2.sub(pt1))
-            uV   = vDir.multiply(1/vDir.Length)
-            #setup the contour
-            color = coin.SoBaseColor()
-            color.rgb = (1, 1, 1)
-            points=coin.SoCoordinate3()
-            lines=coin.SoLineSet()
-            points.point.values = ( (0,0,0),(10,10,10),(10,10,0) )
-
-            #feed data to separator
-            sep=coin.SoSeparator()
-            sep.addChild(points)
-            sep.addChild(color)
-            sep.addChild(lines)
-
-            #add separator to sceneGraph
-            sg = FreeCADGui.ActiveDocument.ActiveView.getSceneGraph()
-            sg.addChild(sep)
-
+            overlay.addLine( [pt1, pt2], width )
 
     def drawLine( self, pt1, pt2, name='aLine', width=3 ):
-        global taskUI
         if pt1!=pt2:
-            line = Part.makeLine( pt1, pt2 )
-            wire = App.ActiveDocument.addObject('Part::FeaturePython', name)
-            wire.ViewObject.Proxy = setCustomIcon(wire, taskUI.lineIcon )
-            wire.Shape = Part.Wire(line)
-            wire.ViewObject.LineWidth = width
-            wire.ViewObject.LineColor = ( 1.0, 1.0, 1.0 )
-            wire.ViewObject.PointSize = 10
-            wire.ViewObject.PointColor= ( 0.0, 0.0, 1.0 )
-            self.addToDims(wire)
+            overlay.addLine( [pt1, pt2], width )
         else:
-            point = App.ActiveDocument.addObject('Part::FeaturePython', 'aPoint')
-            point.ViewObject.Proxy = setCustomIcon(point, taskUI.pointIcon )
-            point.Shape = Part.Vertex(Part.Point( pt1 ))
-            point.ViewObject.PointSize = 10
-            point.ViewObject.PointColor= ( 0.0, 0.0, 1.0 )
-            self.addToDims(point)
+            overlay.addPoint( pt1 )
 
+    # the snap point
     def drawPoint( self, pt ):
-        global taskUI
-        point = App.ActiveDocument.addObject('Part::FeaturePython', 'PtS')
-        point.ViewObject.Proxy = setCustomIcon(point, taskUI.pointIcon )
-        point.Shape = Part.Vertex(Part.Point( pt ))
-        point.ViewObject.PointSize = 10
-        point.ViewObject.PointColor= ( 1.000, 0.667, 0.000 )
-        self.addToDims(point)
-        return point
+        overlay.setSnap( pt )
+        return pt
 
     def annoAngle(self, pos, angle, distance=-1 ):
         global taskUI
-        anno = App.ActiveDocument.addObject("App::AnnotationLabel","AngleLbl")
-        anno.BasePosition = pos
         if distance == -1 or taskUI.Components.isChecked()==False :
-            anno.LabelText = [self.arrondi(angle)+'°']
+            self.drawAnnotation( pos, [self.arrondi(angle)+'°'] )
         else:
-            anno.LabelText = ['Angle: '+self.arrondi(angle)+'°', 'Distance // '+self.arrondi(distance)]
-        annoG = Gui.ActiveDocument.getObject(anno.Name)
-        annoG.FontSize = annoFontSize
-        self.addToDims(anno)
+            self.drawAnnotation( pos, ['Angle: '+self.arrondi(angle)+'°', 'Distance // '+self.arrondi(distance)] )
 
     # round to precision anno_precision
     def arrondi( self, val ):
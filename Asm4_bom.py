@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+# coding: utf-8
+#
+# LGPL
+#
+# Asm4_bom.py
+#
+# the Bill of Materials engine of the Assembly 4 workbench
+# this file doesn't depend on the GUI and can be used from FreeCADCmd:
+#
+# import FreeCAD as App
+# import Asm4_bom
+# doc = App.openDocument('/path/to/assembly.FCStd')
+# for row in Asm4_bom.bomEngine().rows( Asm4_bom.getAssembly(doc) ):
+#     print(row)
+
+
+
+import os, csv
+
+from FreeCAD import Console as FCC
+
+import InfoKeys
+
+
+
+"""
+    +-----------------------------------------------+
+    |               Helper functions                |
+    +-----------------------------------------------+
+"""
+# the user configuration of the part information fields
+def loadConfig():
+    return dict( InfoKeys.loadInfoKeysUser() )
+
+
+# the Assembly4 Model at the root of a document, without the GUI
+def getAssembly(doc):
+    for name in ['Assembly','Model']:
+        assy = doc.getObject(name)
+        if assy and assy.TypeId=='App::Part' and assy.getParentGeoFeatureGroup() is None:
+            return assy
+    return None
+
+
+# the objects directly below a container
+def subObjects(obj):
+    children = []
+    for objName in obj.getSubObjects():
+        child = obj.Document.getObject( objName[0:-1] )
+        if child is not None:
+            children.append(child)
+    return children
+
+
+
+"""
+    +-----------------------------------------------+
+    |                the BOM engine                 |
+    +-----------------------------------------------+
+"""
+# the configuration file is read once, when the engine is created
+# each part (or sub-assembly) is visited only once, even if it is used many times:
+# the engine stores its direct children and the total quantities below it,
+# which give the flat BOM and the multi-level BOM from the same traversal
+# parts are identified by their ( docName, objName ) key
+class bomEngine():
+    def __init__(self, infoKeysUser=None, autoFill=True):
+        if infoKeysUser is None:
+            infoKeysUser = loadConfig()
+        self.infoKeysUser = infoKeysUser
+        # fill the missing part information with InfoKeys.infoDefault
+        self.autoFill = autoFill
+        # key -> App::Part
+        self.parts = {}
+        # key -> { child key: Qty } of the direct children
+        self.children = {}
+        # key -> { key: Qty } of all the parts below (including itself)
+        self.totals = {}
+        # key -> part information, filled when first needed
+        self.infos = {}
+        # objects being visited, to avoid infinite recursion
+        self.visiting = set()
+        # messages for the user
+        self.Verbose = str()
+
+    # visit an object: returns the key of the App::Part it is (or links to),
+    # or None if it's not a part
+    def visit(self, obj):
+        if obj is None:
+            return None
+        if obj.TypeId=='App::Link':
+            return self.visit(obj.LinkedObject)
+        if obj.TypeId!='App::Part':
+            return None
+        key = ( obj.Document.Name, obj.Name )
+        if key in self.totals or key in self.visiting:
+            return key
+        self.visiting.add(key)
+        self.parts[key] = obj
+        self.children[key] = self.countChildren(obj)
+        total = { key: 1 }
+        for child, qty in self.children[key].items():
+            for subKey, nb in self.totals.get(child, {}).items():
+                total[subKey] = total.get(subKey, 0) + qty*nb
+        self.totals[key] = total
+        self.visiting.discard(key)
+        return key
+
+    # the parts directly below obj, as a dict { key: Qty } in the order they are found
+    def countChildren(self, obj):
+        qty = {}
+        for child in subObjects(obj):
+            key = self.visit(child)
+            if key is not None:
+                qty[key] = qty.get(key, 0) + 1
+        return qty
+
+    # the total quantities of all parts in an assembly as a dict { key: Qty },
+    # the assembly itself is not counted
+    def quantities(self, assembly):
+        key = self.visit(assembly)
+        total = dict( self.totals.get(key, {}) )
+        total.pop(key, None)
+        return total
+
+    # the part information of a part, as a dict { field: value }
+    def partInfo(self, key):
+        if key in self.infos:
+            return dict(self.infos[key])
+        part = self.parts[key]
+        info = dict()
+        for prop in self.infoKeysUser:
+            if self.infoKeysUser.get(prop).get('active'):
+                field = self.infoKeysUser.get(prop).get('userData')
+                if not hasattr(part, field) and self.autoFill:
+                    self.Verbose+='you don\'t have fill the info of this Part :'+ part.Label +'\n'
+                    InfoKeys.makePartInfo(part, self.infoKeysUser)
+                    self.Verbose+='info create for :'+ part.Label +'\n'
+                    InfoKeys.infoDefault(part)
+                    self.Verbose+='info auto filled for :'+ part.Label+'\n'
+                info[field] = getattr(part, field, '')
+        self.infos[key] = info
+        return dict(info)
+
+    # generator of the rows of the flat BOM: the part information and the total quantity
+    # parts with the same Label are counted together
+    def rows(self, assembly):
+        byLabel = {}
+        for key, qty in self.quantities(assembly).items():
+            label = self.parts[key].Label
+            if label in byLabel:
+                byLabel[label][1] += qty
+            else:
+                byLabel[label] = [ key, qty ]
+        for key, qty in byLabel.values():
+            row = self.partInfo(key)
+            row['Qty.'] = qty
+            yield row
+
+    # generator of the rows of the multi-level BOM, depth first:
+    # the level and the item number in the tree, the part information,
+    # the quantity in the parent and the total quantity in the assembly
+    def indentedRows(self, assembly):
+        totals = self.quantities(assembly)
+        rootKey = self.visit(assembly)
+        return self.subRows( self.children.get(rootKey, {}), totals, 1, '', {rootKey} )
+
+    def subRows(self, children, totals, level, prefix, path):
+        for index, (key, qty) in enumerate(children.items()):
+            item = prefix + str(index+1)
+            row = { 'Level': level, 'Item': item }
+            row.update( self.partInfo(key) )
+            row['Qty.'] = qty
+            row['Total Qty.'] = totals.get(key, qty)
+            yield row
+            # go down into the sub-assembly
+            if key not in path:
+                yield from self.subRows( self.children.get(key, {}), totals, level+1, item+'.', path | {key} )
+
+
+
+"""
+    +-----------------------------------------------+
+    |              write the BOM tables             |
+    +-----------------------------------------------+
+"""
+# the BOM rows as a table: a header line with the field names, then the values
+def bomTable(rows):
+    table = []
+    for row in rows:
+        if not table:
+            table.append( [ InfoKeys.decodeXml(str(key)) for key in row.keys() ] )
+        table.append( [ str(value) for value in row.values() ] )
+    return table
+
+
+# write the table in a CSV file
+def writeCSV(path, table, delimiter=','):
+    with open(path, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file, delimiter=delimiter)
+        writer.writerows(table)
+    return True
+
+
+# write the table in an Excel file, this needs the openpyxl module
+def writeXLSX(path, table, title='BOM'):
+    try:
+        import openpyxl
+    except ImportError:
+        FCC.PrintWarning('The Python module \"openpyxl\" is not installed, can\'t write '+path+'\n')
+        return False
+    workbook = openpyxl.Workbook(write_only=True)
+    worksheet = workbook.create_sheet(title)
+    for line in table:
+        worksheet.append(line)
+    workbook.save(path)
+    return True
+
+
+# write the table in a file, the format is chosen with the file extension
+def writeFile(path, table):
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.xlsx':
+        return writeXLSX(path, table)
+    elif ext == '.tsv':
+        return writeCSV(path, table, delimiter='\t')
+    return writeCSV(path, table)
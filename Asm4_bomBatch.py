@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# coding: utf-8
+#
+# LGPL
+#
+# Asm4_bomBatch.py
+#
+# creates the Bill of Materials of many Assembly4 documents without the GUI
+# each document is opened and traversed in its own worker process,
+# and all BOMs are written in a single CSV or JSON file
+#
+# usage (FreeCAD must be importable, or its lib directory given with --freecad-lib):
+#
+# python3 Asm4_bomBatch.py -o BOM.csv assembly_1.FCStd assembly_2.FCStd ...
+# python3 Asm4_bomBatch.py -j 8 --multi-level -o BOM.json variants/*.FCStd
+
+
+
+import os, sys, json, csv, argparse
+import multiprocessing
+
+wbPath = os.path.dirname(os.path.abspath(__file__))
+
+
+
+"""
+    +-----------------------------------------------+
+    |                  the worker                   |
+    +-----------------------------------------------+
+"""
+# make FreeCAD and this workbench importable in the worker
+def initWorker(freecadLib):
+    if freecadLib and freecadLib not in sys.path:
+        sys.path.append(freecadLib)
+    if wbPath not in sys.path:
+        sys.path.append(wbPath)
+
+
+# open a document, make its BOM and close it again
+# returns ( fileName, rows, error )
+def documentBOM(task):
+    (fileName, multiLevel) = task
+    try:
+        import FreeCAD as App
+        import Asm4_bom
+        doc = App.openDocument(fileName)
+        try:
+            assembly = Asm4_bom.getAssembly(doc)
+            if assembly is None:
+                return ( fileName, [], 'no Assembly4 Model found' )
+            # the part information isn't changed: documents aren't saved
+            engine = Asm4_bom.bomEngine(autoFill=False)
+            if multiLevel:
+                rows = list(engine.indentedRows(assembly))
+            else:
+                rows = list(engine.rows(assembly))
+            # only keep JSON-friendly values
+            rows = [ { key: value if isinstance(value,(int,float)) else str(value)
+                        for key, value in row.items() } for row in rows ]
+            return ( fileName, rows, None )
+        finally:
+            App.closeDocument(doc.Name)
+    except Exception as err:
+        return ( fileName, [], str(err) )
+
+
+
+"""
+    +-----------------------------------------------+
+    |            write the consolidated BOM         |
+    +-----------------------------------------------+
+"""
+def writeCSV(path, results):
+    # all columns of all documents, in the order they are found
+    columns = ['File']
+    for (fileName, rows, error) in results:
+        for row in rows:
+            for key in row:
+                if key not in columns:
+                    columns.append(key)
+    with open(path, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.DictWriter(file, fieldnames=columns, restval='')
+        writer.writeheader()
+        for (fileName, rows, error) in results:
+            for row in rows:
+                line = { 'File': os.path.basename(fileName) }
+                line.update(row)
+                writer.writerow(line)
+
+
+def writeJSON(path, results):
+    data = []
+    for (fileName, rows, error) in results:
+        data.append( { 'File': fileName, 'Error': error, 'BOM': rows } )
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(data, file, indent=1)
+
+
+
+"""
+    +-----------------------------------------------+
+    |                     main                      |
+    +-----------------------------------------------+
+"""
+def batchBOM(fileNames, output, jobs=None, multiLevel=False, freecadLib=None):
+    tasks = [ (os.path.abspath(fileName), multiLevel) for fileName in fileNames ]
+    # FreeCAD isn't fork-safe, and a new process for each document frees its memory
+    context = multiprocessing.get_context('spawn')
+    with context.Pool( processes=jobs, initializer=initWorker, initargs=(freecadLib,),
+                       maxtasksperchild=1 ) as pool:
+        results = pool.map(documentBOM, tasks, chunksize=1)
+    for (fileName, rows, error) in results:
+        if error:
+            print('Error in '+fileName+' : '+error, file=sys.stderr)
+    if output.lower().endswith('.json'):
+        writeJSON(output, results)
+    else:
+        writeCSV(output, results)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser( description='Creates the Bill of Materials of Assembly4 documents' )
+    parser.add_argument('files', nargs='+', help='the FreeCAD documents (.FCStd)')
+    parser.add_argument('-o', '--output', default='BOM.csv', help='the output file, .csv or .json')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='number of worker processes')
+    parser.add_argument('--multi-level', action='store_true', help='make a multi-level BOM')
+    parser.add_argument('--freecad-lib', default=None, help='the directory of the FreeCAD Python module')
+    args = parser.parse_args(argv)
+    results = batchBOM( args.files, args.output, args.jobs, args.multi_level, args.freecad_lib )
+    nbErrors = len( [ r for r in results if r[2] ] )
+    print( str(len(results)-nbErrors)+' BOM written to '+args.output )
+    return 1 if nbErrors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
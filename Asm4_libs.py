@@ -14,11 +14,13 @@
     +-----------------------------------------------+
 """
 
-import os
+import os, csv, tempfile
 #__dir__ = os.path.dirname(__file__)
 wbPath   = os.path.dirname(__file__)
 iconPath = os.path.join( wbPath, 'Resources/icons' )
 libPath  = os.path.join( wbPath, 'Resources/library' )
+# the preferences of the workbench
+paramPath = 'User parameter:BaseApp/Preferences/Mod/Assembly4'
 
 from PySide import QtGui, QtCore
 import FreeCADGui as Gui
@@ -44,14 +46,127 @@ containerTypes = [  'App::Part', 'PartDesign::Body' ]
 
 
 
-def findObjectLink(obj, doc = App.ActiveDocument):
-    for o in doc.Objects:
-        if hasattr(o, 'LinkedObject'):
-            if o.LinkedObject == obj:
-                return o
+# returns a link to obj in doc (the active document by default)
+def findObjectLink(obj, doc = None):
+    if doc is None:
+        doc = App.ActiveDocument
+    for link in findObjectLinks(obj, doc):
+        return link
     return(None)
 
 
+# returns all links to obj in all open documents, or only in doc if given
+# the links come from the reverse-link index below
+def findObjectLinks(obj, doc = None):
+    links = []
+    for link in linkIndex.linksTo(obj):
+        if doc is None or link.Document == doc:
+            links.append(link)
+    return links
+
+
+# index of the objects with a LinkedObject property, by linked object
+# it covers all open documents and is maintained by the document observer:
+# a document is scanned once when first needed, then updated for each change
+class linkIndexObserver():
+    def __init__(self):
+        # ( docName, objName ) of the linked object -> set of ( docName, linkName )
+        self.links = {}
+        # ( docName, linkName ) -> ( docName, objName ) of the linked object
+        self.targets = {}
+        # documents already scanned
+        self.indexedDocs = set()
+        # ( docName, objName ) of the objects created since the last query,
+        # pasted or imported objects get their LinkedObject without a change notification
+        self.created = set()
+
+    def key(self, obj):
+        return ( obj.Document.Name, obj.Name )
+
+    def addLink(self, link):
+        self.removeLink(link)
+        target = getattr(link, 'LinkedObject', None)
+        # LinkedObject can be a (obj, subname) tuple for sub-element links
+        if isinstance(target, tuple):
+            target = target[0]
+        if target is not None and hasattr(target, 'Document'):
+            self.targets[self.key(link)] = self.key(target)
+            self.links.setdefault( self.key(target), set() ).add( self.key(link) )
+
+    def removeLink(self, link):
+        linkKey = self.key(link)
+        target = self.targets.pop( linkKey, None )
+        if target in self.links:
+            self.links[target].discard(linkKey)
+            if not self.links[target]:
+                del self.links[target]
+
+    def indexDocument(self, doc):
+        self.dropDocument(doc.Name)
+        for obj in doc.Objects:
+            if hasattr(obj, 'LinkedObject'):
+                self.addLink(obj)
+        self.indexedDocs.add(doc.Name)
+
+    def dropDocument(self, docName):
+        self.indexedDocs.discard(docName)
+        self.created = set( k for k in self.created if k[0] != docName )
+        for linkKey in [ k for k in self.targets if k[0] == docName ]:
+            target = self.targets.pop(linkKey)
+            self.links[target].discard(linkKey)
+            if not self.links[target]:
+                del self.links[target]
+
+    # all links to obj, in all open documents
+    def linksTo(self, obj):
+        docs = App.listDocuments()
+        for docName in docs:
+            if docName not in self.indexedDocs:
+                self.indexDocument(docs[docName])
+        for (docName, objName) in self.created:
+            if docName in docs:
+                created = docs[docName].getObject(objName)
+                if created is not None and hasattr(created, 'LinkedObject'):
+                    self.addLink(created)
+        self.created.clear()
+        links = []
+        for (docName, linkName) in sorted( self.links.get(self.key(obj), ()) ):
+            link = docs[docName].getObject(linkName)
+            if link is not None:
+                links.append(link)
+        return links
+
+    # document observer API
+    def slotCreatedObject(self, obj):
+        if obj.Document.Name in self.indexedDocs:
+            self.created.add( self.key(obj) )
+
+    def slotChangedObject(self, obj, prop):
+        if prop == 'LinkedObject' and obj.Document.Name in self.indexedDocs:
+            self.addLink(obj)
+
+    def slotDeletedObject(self, obj):
+        if obj.Document.Name in self.indexedDocs:
+            self.created.discard( self.key(obj) )
+            self.removeLink(obj)
+
+    def slotFinishRestoreDocument(self, doc):
+        self.dropDocument(doc.Name)
+
+    def slotDeletedDocument(self, doc):
+        self.dropDocument(doc.Name)
+
+    def slotUndoDocument(self, doc):
+        self.dropDocument(doc.Name)
+
+    def slotRedoDocument(self, doc):
+        self.dropDocument(doc.Name)
+
+
+linkIndex = linkIndexObserver()
+App.addDocumentObserver(linkIndex)
+
+
 def getSelectionPath(docName, objName, subObjName):
         val = []
         if (docName is None) or (docName == ''):
@@ -282,7 +397,17 @@ def getSelectionTree(index=0):
 
 
 # get all datums in a part
-def getPartLCS( part ):
+# if datumType is given, only datums of that type are returned
+# the result comes from the datum index below, and is built only once per container
+def getPartLCS( part, datumType=None ):
+    partLCS = datumIndex.get( part )
+    if datumType:
+        return [ datum for datum in partLCS if datum.TypeId == datumType ]
+    return list(partLCS)
+
+
+# parse the part for datums, this is slow on big parts
+def scanPartLCS( part ):
     partLCS = [ ]
     # parse all objects in the part (they return strings)
     for objName in part.getSubObjects(1):
@@ -292,12 +417,54 @@ def getPartLCS( part ):
         if obj.TypeId in datumTypes:
             partLCS.append( obj )
         elif obj.TypeId == 'App::DocumentObjectGroup':
-            datums = getPartLCS(obj)
+            datums = scanPartLCS(obj)
             for datum in datums:
                 partLCS.append(datum)
     return partLCS
 
 
+# index of the datums in each container, per document
+# it's a document observer, and drops the index of a document
+# as soon as objects are added, removed or moved between groups
+class datumIndexObserver():
+    def __init__(self):
+        # docName -> { containerName -> [ datums ] }
+        self.index = {}
+
+    def get(self, part):
+        docIndex = self.index.setdefault( part.Document.Name, {} )
+        if part.Name not in docIndex:
+            docIndex[part.Name] = scanPartLCS(part)
+        return docIndex[part.Name]
+
+    def invalidate(self, doc):
+        self.index.pop( doc.Name, None )
+
+    # document observer API
+    def slotCreatedObject(self, obj):
+        self.invalidate(obj.Document)
+
+    def slotDeletedObject(self, obj):
+        self.invalidate(obj.Document)
+
+    def slotChangedObject(self, obj, prop):
+        if prop == 'Group':
+            self.invalidate(obj.Document)
+
+    def slotDeletedDocument(self, doc):
+        self.invalidate(doc)
+
+    def slotUndoDocument(self, doc):
+        self.invalidate(doc)
+
+    def slotRedoDocument(self, doc):
+        self.invalidate(doc)
+
+
+datumIndex = datumIndexObserver()
+App.addDocumentObserver(datumIndex)
+
+
 # get the document group called Part
 # (if it exists, else return None
 def getPartsGroup():
@@ -348,6 +515,38 @@ def placementEE( EE ):
 
 
 
+"""
+    +-----------------------------------------------+
+    |      write a table into a spreadsheet         |
+    +-----------------------------------------------+
+"""
+# write a table into a spreadsheet in one transaction:
+# the table is written to a temporary file which is imported as a whole
+# by the spreadsheet, instead of setting each cell separately
+def writeSheet(sheet, table):
+    doc = sheet.Document
+    doc.openTransaction('Write '+sheet.Label)
+    try:
+        sheet.clearAll()
+        if table:
+            (fd, path) = tempfile.mkstemp(suffix='.csv')
+            try:
+                with os.fdopen(fd, 'w', newline='', encoding='utf-8') as file:
+                    # the spreadsheet reads the file line by line, and uses \ as escape character
+                    writer = csv.writer(file, delimiter='\t', quotechar='"', escapechar='\\',
+                                        doublequote=False, quoting=csv.QUOTE_ALL, lineterminator='\n')
+                    for line in table:
+                        writer.writerow( [ cell.replace('\n',' ') for cell in line ] )
+                sheet.importFile(path, '\t', '"', '\\')
+            finally:
+                os.remove(path)
+    finally:
+        doc.commitTransaction()
+    return sheet
+
+
+
+
 """
     +-----------------------------------------------+
     |              some geometry tests              |
@@ -445,6 +644,15 @@ def isAsm4EE(obj):
     return False
 
 
+def isAsm4Native(obj):
+    if not obj:
+        return False
+    # placed by the native Asm4 solver, see Asm4_solver.py
+    if hasattr(obj,'SolverId') and obj.SolverId == 'Placement::Asm4Native':
+        return True
+    return False
+
+
 """
     +-----------------------------------------------+
     |           Shows a Warning message box         |
@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+# coding: utf-8
+#
+# LGPL
+#
+# Asm4_measureBatch.py
+#
+# measures many pairs of shapes or points without the GUI:
+# distances, angles and clearances, written in a CSV or JSON report
+# the pairs of points are measured together with NumPy, the pairs of shapes
+# through the spatial index of Asm4_spatial, which samples each shape only once
+#
+# from FreeCADCmd or the Python console:
+#
+# import Asm4_measureBatch
+# checks = [ ('Part001.Body.Face3', 'Part002.Body.Face1', 2.0),
+#            ('0,0,0', 'LCS_1'), ... ]
+# results = Asm4_measureBatch.measurePairs(checks, App.ActiveDocument)
+# Asm4_measureBatch.writeReport('clearances.csv', results)
+#
+# or the same checks on many documents, each one in its own worker process
+# (FreeCAD must be importable, or its lib directory given with --freecad-lib):
+#
+# python3 Asm4_measureBatch.py -j 8 -o report.csv checks.csv assembly_1.FCStd assembly_2.FCStd ...
+#
+# the checks file is a CSV file with the columns Name, First, Second and Required (optional),
+# or a JSON list of objects with the same keys. First and Second are points "x,y,z",
+# objects "Part001" or sub-elements "Part001.Body.Face3", from the root of the document
+
+
+
+import os, sys, re, json, csv, math, argparse
+import multiprocessing
+
+wbPath = os.path.dirname(os.path.abspath(__file__))
+
+
+
+"""
+    +-----------------------------------------------+
+    |               Helper functions                |
+    +-----------------------------------------------+
+"""
+# the columns of the report
+reportColumns = [ 'Name', 'First', 'Second', 'Distance', 'ΔX', 'ΔY', 'ΔZ', 'Angle',
+                  'Required', 'Clearance', 'Status', 'Point1', 'Point2', 'Error' ]
+
+pointPattern = re.compile( r'^\s*\(?\s*([-+0-9.eE]+)\s*[,; ]\s*([-+0-9.eE]+)\s*[,; ]\s*([-+0-9.eE]+)\s*\)?\s*$' )
+elementPattern = re.compile( r'^(Face|Edge|Vertex)[0-9]+$' )
+
+
+# a check as a dict { Name, First, Second, Required }
+# from a tuple ( first, second [, required [, name ] ] ) or a dict
+def makeCheck(check, index):
+    if isinstance(check, dict):
+        result = dict(check)
+    else:
+        result = { 'First': check[0], 'Second': check[1] }
+        if len(check) > 2:
+            result['Required'] = check[2]
+        if len(check) > 3:
+            result['Name'] = check[3]
+    if not result.get('Name'):
+        result['Name'] = 'Check_'+str(index+1)
+    required = result.get('Required')
+    result['Required'] = float(required) if required not in (None, '') else None
+    return result
+
+
+# a reference as an App.Vector (a point) or a Part shape
+# references are points, Part shapes, or names of objects and sub-elements in the document
+def resolve(ref, doc):
+    import FreeCAD as App
+    import Part
+    if isinstance(ref, App.Vector):
+        return ref
+    if isinstance(ref, Part.Shape):
+        return ref
+    if isinstance(ref, (list, tuple)) and len(ref)==3:
+        return App.Vector( *[ float(x) for x in ref ] )
+    ref = str(ref)
+    point = pointPattern.match(ref)
+    if point:
+        return App.Vector( *[ float(x) for x in point.groups() ] )
+    if doc is None:
+        raise ValueError('no document to find '+ref)
+    names = ref.split('.')
+    obj = doc.getObject(names[0])
+    if obj is None:
+        objs = doc.getObjectsByLabel(names[0])
+        obj = objs[0] if objs else None
+    if obj is None:
+        raise ValueError('object '+names[0]+' not found')
+    # the last name is a sub-element, or an object
+    subName = '.'.join(names[1:])
+    if subName and not elementPattern.match(names[-1]):
+        subName += '.'
+    shape = Part.getShape(obj, subName, needSubElement=True)
+    if shape.isNull():
+        raise ValueError(ref+' has no shape')
+    return shape
+
+
+def isPoint(item):
+    import FreeCAD as App
+    return isinstance(item, App.Vector)
+
+
+def pointString(pt):
+    return '{0:.6f},{1:.6f},{2:.6f}'.format(pt[0], pt[1], pt[2])
+
+
+# the direction of a shape, be it a segment, a line, a circle or a flat face
+# (same as the Measure tool)
+def shapeDirection(shape):
+    import FreeCAD as App
+    if not shape.isValid():
+        return None
+    curve = getattr(shape, 'Curve', None)
+    if curve is not None and curve.TypeId=='Part::GeomLine':
+        # for a segment, it's the normalized vector along the segment
+        if len(shape.Vertexes)==2:
+            vect = shape.Vertexes[1].Point.sub(shape.Vertexes[0].Point)
+            if vect.Length != 0:
+                return vect / vect.Length
+            return None
+        # for another line (like Datum::Line) it's the Z vector of its Placement
+        return shape.Placement.Rotation.multVec(App.Vector(0,0,1))
+    # for a Circle it's the circle's axis
+    if curve is not None and curve.TypeId=='Part::GeomCircle':
+        return curve.Axis
+    # for a flat face it's the normal
+    if isFlatFace(shape):
+        return shape.normalAt(0,0)
+    return None
+
+
+def isFlatFace(shape):
+    return shape.isValid() and hasattr(shape,'Area') and shape.Area > 1.0e-6 \
+                           and hasattr(shape,'Volume') and shape.Volume < 1.0e-9
+
+
+# the angles in degrees between the directions (N,3) and (N,3) of pairs of shapes
+# flat1 and flat2 tell whether the shapes are flat faces, measured by their normal
+def shapeAngles(dir1, dir2, flat1, flat2):
+    import numpy
+    dir1 = numpy.asarray(dir1, dtype=float).reshape(-1,3)
+    dir2 = numpy.asarray(dir2, dtype=float).reshape(-1,3)
+    flat1 = numpy.asarray(flat1, dtype=bool)
+    flat2 = numpy.asarray(flat2, dtype=bool)
+    norms = numpy.linalg.norm(dir1, axis=1) * numpy.linalg.norm(dir2, axis=1)
+    cos = numpy.einsum('ij,ij->i', dir1, dir2) / numpy.where(norms>0, norms, 1.0)
+    angle = numpy.degrees( numpy.arccos( numpy.clip(cos, -1.0, 1.0) ) )
+    # 2 flat faces
+    both = flat1 & flat2
+    angle = numpy.where( both, 180.0-angle, angle )
+    # 1 flat face and 1 direction
+    angle = numpy.where( flat1 ^ flat2, 90.0-angle, angle )
+    angle = numpy.where( ~both & (angle>90.0), 180.0-angle, angle )
+    return angle
+
+
+# the angle in degrees between 2 shapes, None if they have no direction
+def shapeAngle(shape1, shape2):
+    dir1 = shapeDirection(shape1)
+    dir2 = shapeDirection(shape2)
+    if dir1 is None or dir2 is None:
+        return None
+    return float( shapeAngles( [tuple(dir1)], [tuple(dir2)], [isFlatFace(shape1)], [isFlatFace(shape2)] )[0] )
+
+
+
+"""
+    +-----------------------------------------------+
+    |                 the measures                  |
+    +-----------------------------------------------+
+"""
+# measure a list of checks in a document, returns a list of dicts with the reportColumns
+def measurePairs(checks, doc=None):
+    import numpy
+    import Part
+    import Asm4_spatial
+    docName = doc.Name if doc is not None else None
+    checks = [ makeCheck(check, i) for (i, check) in enumerate(checks) ]
+    results = []
+    items = []
+    for check in checks:
+        result = { 'Name': check['Name'], 'First': str(check['First']), 'Second': str(check['Second']),
+                   'Required': check['Required'], 'Error': '' }
+        try:
+            items.append( ( resolve(check['First'], doc), resolve(check['Second'], doc) ) )
+        except Exception as err:
+            items.append(None)
+            result['Error'] = str(err)
+        results.append(result)
+    pt1 = numpy.full( (len(checks), 3), numpy.nan )
+    pt2 = numpy.full( (len(checks), 3), numpy.nan )
+    # the pairs of points are measured below with the others, all at once
+    for (i, item) in enumerate(items):
+        if item is not None and isPoint(item[0]) and isPoint(item[1]):
+            pt1[i] = tuple(item[0])
+            pt2[i] = tuple(item[1])
+    # the pairs with a shape, through the spatial index
+    for (i, item) in enumerate(items):
+        if item is None or ( isPoint(item[0]) and isPoint(item[1]) ):
+            continue
+        try:
+            shapes = [ Part.Vertex(Part.Point(x)) if isPoint(x) else x for x in item ]
+            (dist, p1, p2) = Asm4_spatial.shapeDistance( shapes[0], shapes[1], docName )
+            pt1[i] = tuple(p1)
+            pt2[i] = tuple(p2)
+        except Exception as err:
+            results[i]['Error'] = str(err)
+    delta = pt1 - pt2
+    dist = numpy.sqrt( numpy.einsum('ij,ij->i', delta, delta) )
+    # the angles of the pairs of shapes with a direction
+    angled = []
+    dirs = []
+    for (i, item) in enumerate(items):
+        if item is None or isPoint(item[0]) or isPoint(item[1]):
+            continue
+        d1 = shapeDirection(item[0])
+        d2 = shapeDirection(item[1])
+        if d1 is not None and d2 is not None:
+            angled.append(i)
+            dirs.append( ( tuple(d1), tuple(d2), isFlatFace(item[0]), isFlatFace(item[1]) ) )
+    angles = {}
+    if angled:
+        (dir1, dir2, flat1, flat2) = zip(*dirs)
+        angles = dict( zip( angled, shapeAngles(dir1, dir2, flat1, flat2) ) )
+    for (i, result) in enumerate(results):
+        if numpy.isnan(dist[i]):
+            continue
+        result['Distance'] = float(dist[i])
+        result['ΔX'] = float(delta[i,0])
+        result['ΔY'] = float(delta[i,1])
+        result['ΔZ'] = float(delta[i,2])
+        result['Point1'] = pointString(pt1[i])
+        result['Point2'] = pointString(pt2[i])
+        if i in angles:
+            result['Angle'] = float(angles[i])
+        if result['Required'] is not None:
+            result['Clearance'] = float(dist[i]) - result['Required']
+            result['Status'] = 'OK' if result['Clearance'] >= 0 else 'FAIL'
+    return results
+
+
+# read the checks from a CSV or JSON file
+def readChecks(path):
+    if path.lower().endswith('.json'):
+        with open(path, encoding='utf-8') as file:
+            return json.load(file)
+    with open(path, newline='', encoding='utf-8') as file:
+        return [ row for row in csv.DictReader(file) ]
+
+
+
+"""
+    +-----------------------------------------------+
+    |                write the report               |
+    +-----------------------------------------------+
+"""
+def writeCSV(path, results):
+    columns = [ column for column in reportColumns ]
+    if any( 'File' in result for result in results ):
+        columns.insert(0, 'File')
+    with open(path, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.DictWriter(file, fieldnames=columns, restval='', extrasaction='ignore')
+        writer.writeheader()
+        for result in results:
+            writer.writerow( { key: '' if value is None else value for key, value in result.items() } )
+
+
+def writeJSON(path, results):
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(results, file, indent=1, ensure_ascii=False)
+
+
+# write the results in a file, the format is chosen with the file extension
+def writeReport(path, results):
+    if path.lower().endswith('.json'):
+        writeJSON(path, results)
+    else:
+        writeCSV(path, results)
+    return True
+
+
+
+"""
+    +-----------------------------------------------+
+    |                  the worker                   |
+    +-----------------------------------------------+
+"""
+# make FreeCAD and this workbench importable in the worker
+def initWorker(freecadLib):
+    if freecadLib and freecadLib not in sys.path:
+        sys.path.append(freecadLib)
+    if wbPath not in sys.path:
+        sys.path.append(wbPath)
+
+
+# open a document, measure the checks and close it again
+# returns ( fileName, results, error )
+def documentMeasures(task):
+    (fileName, checks) = task
+    try:
+        import FreeCAD as App
+        doc = App.openDocument(fileName)
+        try:
+            results = measurePairs(checks, doc)
+            for result in results:
+                result['File'] = os.path.basename(fileName)
+            return ( fileName, results, None )
+        finally:
+            App.closeDocument(doc.Name)
+    except Exception as err:
+        return ( fileName, [], str(err) )
+
+
+
+"""
+    +-----------------------------------------------+
+    |                     main                      |
+    +-----------------------------------------------+
+"""
+def batchMeasures(checks, fileNames, output, jobs=None, freecadLib=None):
+    jobs = jobs or os.cpu_count() or 1
+    # with fewer documents than workers, the checks of a document are split
+    nbChunks = max( 1, int( math.ceil( jobs/len(fileNames) ) ) ) if fileNames else 1
+    size = max( 1, int( math.ceil( len(checks)/nbChunks ) ) )
+    tasks = []
+    for fileName in fileNames:
+        for start in range(0, max(len(checks),1), size):
+            tasks.append( ( os.path.abspath(fileName), checks[start:start+size] ) )
+    # FreeCAD isn't fork-safe, and a new process for each task frees its memory
+    context = multiprocessing.get_context('spawn')
+    with context.Pool( processes=jobs, initializer=initWorker, initargs=(freecadLib,),
+                       maxtasksperchild=1 ) as pool:
+        answers = pool.map(documentMeasures, tasks, chunksize=1)
+    results = []
+    for (fileName, rows, error) in answers:
+        if error:
+            print('Error in '+fileName+' : '+error, file=sys.stderr)
+        results.extend(rows)
+    writeReport(output, results)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser( description='Measures distances, angles and clearances in FreeCAD documents' )
+    parser.add_argument('checks', help='the checks, a .csv or .json file')
+    parser.add_argument('files', nargs='+', help='the FreeCAD documents (.FCStd)')
+    parser.add_argument('-o', '--output', default='measures.csv', help='the report, .csv or .json')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='number of worker processes')
+    parser.add_argument('--freecad-lib', default=None, help='the directory of the FreeCAD Python module')
+    args = parser.parse_args(argv)
+    results = batchMeasures( readChecks(args.checks), args.files, args.output, args.jobs, args.freecad_lib )
+    nbFailed = len( [ r for r in results if r.get('Status')=='FAIL' or r.get('Error') ] )
+    print( str(len(results))+' measures written to '+args.output+', '+str(nbFailed)+' failed' )
+    return 1 if nbFailed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
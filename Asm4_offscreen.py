@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# coding: utf-8
+#
+# LGPL
+#
+# Asm4_offscreen.py
+#
+# renders a scene with the Coin offscreen renderer directly into a NumPy RGBA array,
+# without writing image files and without a visible window
+# the 3D view of the GUI can be rendered, or a document without the GUI (from FreeCADCmd):
+#
+# import FreeCAD as App
+# import Asm4_offscreen
+# doc = App.openDocument('/path/to/assembly.FCStd')
+# rgba = Asm4_offscreen.renderDocument(doc, (1920, 1080))
+# Asm4_offscreen.toImage(rgba).save('/path/to/assembly.png')
+#
+# an OpenGL context is still needed: on a machine without display, use a virtual one (xvfb)
+
+
+
+import numpy
+
+import FreeCAD as App
+from pivy import coin
+
+
+
+"""
+    +-----------------------------------------------+
+    |                   settings                    |
+    +-----------------------------------------------+
+"""
+# the background color of the 3D view, as ( r, g, b ) in [0,1]
+def viewBackground():
+    color = App.ParamGet('User parameter:BaseApp/Preferences/View').GetUnsigned('BackgroundColor', 336897023)
+    return ( ((color>>24)&0xFF)/255.0, ((color>>16)&0xFF)/255.0, ((color>>8)&0xFF)/255.0 )
+
+
+
+"""
+    +-----------------------------------------------+
+    |                  the renderer                 |
+    +-----------------------------------------------+
+"""
+# the renderers are kept for each size, creating the OpenGL context is slow
+renderers = {}
+
+def getRenderer(size):
+    size = ( int(size[0]), int(size[1]) )
+    if size not in renderers:
+        viewport = coin.SbViewportRegion(size[0], size[1])
+        renderer = coin.SoOffscreenRenderer(viewport)
+        renderer.setComponents(coin.SoOffscreenRenderer.RGB_TRANSPARENCY)
+        renderers[size] = renderer
+    return renderers[size]
+
+
+# render a scene (with a camera) into an array of shape (height, width, 4)
+# if transparent, the pixels without objects have alpha = 0, else alpha = 255
+def renderScene(root, size, background=(1.0, 1.0, 1.0), transparent=False):
+    renderer = getRenderer(size)
+    renderer.setBackgroundColor( coin.SbColor(*background) )
+    if not renderer.render(root):
+        raise RuntimeError('Offscreen rendering failed, no OpenGL context available')
+    buffer = numpy.frombuffer( bytes(renderer.getBuffer()), dtype=numpy.uint8 )
+    # OpenGL images start with the bottom line
+    rgba = buffer.reshape( (int(size[1]), int(size[0]), 4) )[::-1]
+    if not transparent:
+        rgba = rgba.copy()
+        rgba[:,:,3] = 255
+    return numpy.ascontiguousarray(rgba)
+
+
+# convert an array to a PIL image, this needs the PIL module
+def toImage(rgba):
+    from PIL import Image
+    return Image.fromarray(rgba, 'RGBA')
+
+
+
+"""
+    +-----------------------------------------------+
+    |                   the scenes                  |
+    +-----------------------------------------------+
+"""
+# the scene of a 3D view of the GUI, seen by its camera
+def viewScene(view):
+    root = coin.SoSeparator()
+    root.addChild( view.getCameraNode() )
+    root.addChild( coin.SoDirectionalLight() )
+    root.addChild( view.getSceneGraph() )
+    return root
+
+
+# render a 3D view of the GUI, mode is as in View3DInventor.saveImage:
+# 'Current' (background of the view), 'Transparent', 'White' or 'Black'
+def renderView(view, size, mode='Current'):
+    backgrounds = { 'White': (1.0, 1.0, 1.0), 'Black': (0.0, 0.0, 0.0) }
+    background = backgrounds.get(mode, viewBackground())
+    return renderScene( viewScene(view), size, background, transparent=(mode=='Transparent') )
+
+
+# the triangles of a shape as a Coin node, in the global coordinates
+def shapeNode(shape, color=(0.8, 0.8, 0.8), tolerance=0.1):
+    (points, triangles) = shape.tessellate(tolerance)
+    node = coin.SoSeparator()
+    material = coin.SoMaterial()
+    material.diffuseColor = coin.SbColor(*color)
+    node.addChild(material)
+    coords = coin.SoCoordinate3()
+    coords.point.setValues( 0, len(points), [ (p.x, p.y, p.z) for p in points ] )
+    node.addChild(coords)
+    faces = coin.SoIndexedFaceSet()
+    index = []
+    for triangle in triangles:
+        index.extend( [ triangle[0], triangle[1], triangle[2], -1 ] )
+    faces.coordIndex.setValues(0, len(index), index)
+    node.addChild(faces)
+    return node
+
+
+# the scene of a document without the GUI: the shapes of the given objects
+# (by default the Assembly4 Model, with all its links), seen from the direction
+def documentScene(doc, size, objects=None, direction=(-1.0, 1.0, -1.0), tolerance=0.1):
+    import Part
+    if objects is None:
+        objects = [ obj for obj in [ doc.getObject('Assembly'), doc.getObject('Model') ]
+                    if obj and obj.TypeId=='App::Part' ]
+    scene = coin.SoSeparator()
+    for obj in objects:
+        shape = Part.getShape(obj)
+        if not shape.isNull():
+            scene.addChild( shapeNode(shape, tolerance=tolerance) )
+    root = coin.SoSeparator()
+    camera = coin.SoOrthographicCamera()
+    camera.orientation.setValue( coin.SbRotation( coin.SbVec3f(0, 0, -1), coin.SbVec3f(*direction) ) )
+    root.addChild(camera)
+    root.addChild( coin.SoDirectionalLight() )
+    root.addChild(scene)
+    camera.viewAll( scene, coin.SbViewportRegion(int(size[0]), int(size[1])) )
+    return root
+
+
+def renderDocument(doc, size, objects=None, direction=(-1.0, 1.0, -1.0), background=(1.0, 1.0, 1.0), transparent=False):
+    return renderScene( documentScene(doc, size, objects, direction), size, background, transparent )
@@ -0,0 +1,646 @@
+#!/usr/bin/env python3
+# coding: utf-8
+#
+# LGPL
+#
+# Asm4_solver.py
+#
+# solver helpers for FreeCAD's Assembly 4 workbench
+# this file doesn't depend on the GUI and can be used from FreeCADCmd
+
+
+
+import re
+from collections import deque
+
+import numpy
+
+import FreeCAD as App
+from FreeCAD import Console as FCC
+
+
+
+"""
+    +-----------------------------------------------+
+    |                  parameters                   |
+    +-----------------------------------------------+
+"""
+# the solver settings are in the Assembly4 preferences, whose path is in Asm4_libs
+# Asm4_libs needs the GUI modules: without them, there are no preferences
+def getParameters():
+    try:
+        from Asm4_libs import paramPath
+    except ImportError:
+        return None
+    return App.ParamGet(paramPath)
+
+# without preferences, the defaults are used
+def getSetting(name, default=False):
+    params = getParameters()
+    if params is None:
+        return default
+    return params.GetBool(name, default)
+
+# if set, the "Solve and Update Assembly" command only recomputes
+# the links that have changed since the last solve, and those depending on them
+def isIncremental():
+    return getSetting('IncrementalSolver')
+
+# if set, newly placed links use the native Asm4 solver instead of the ExpressionEngine
+def isNative():
+    return getSetting('NativeSolver')
+
+# if set, the objects placed by the native solver are solved together,
+# level by level, with NumPy matrix products
+def isBatch():
+    return getSetting('BatchSolver')
+
+# the SolverId of objects placed by the native solver
+nativeSolverId = 'Placement::Asm4Native'
+
+# properties that change the placement of an Asm4 object
+watchedProperties = [   'Placement',
+                        'AttachmentOffset',
+                        'AttachedTo',
+                        'AttachedBy',
+                        'LinkedObject',
+                        'ExpressionEngine' ]
+
+# Types of datum objects (same as in Asm4_libs, which needs the GUI)
+datumTypes = [  'PartDesign::CoordinateSystem', \
+                'PartDesign::Plane',            \
+                'PartDesign::Line',             \
+                'PartDesign::Point']
+
+# object references in an expression:
+# LCS_1.Placement , Part#LCS_1.Placement , Variables.Length ...
+exprRefRegex = re.compile( r'(?:(\w+)#)?(\w+)\.\w+' )
+
+
+
+"""
+    +-----------------------------------------------+
+    |               dependency graph                |
+    +-----------------------------------------------+
+"""
+# returns True if the object is placed by an Asm4 solver
+def isSolverNode(obj):
+    if hasattr(obj,'AttachedTo') and hasattr(obj,'SolverId'):
+        if obj.AttachedTo and obj.SolverId:
+            return True
+    return False
+
+
+# returns the parent link name of an object from its AttachedTo property:
+# AttachedTo = parentLink#LCS or 'Parent Assembly#LCS'
+def attachedParent(obj):
+    (a_Link, sep, a_LCS) = obj.AttachedTo.partition('#')
+    if a_Link and a_Link != 'Parent Assembly':
+        return a_Link
+    return None
+
+
+# all objects referenced in the expressions of an object
+# returns a set of ( docName, objName )
+def expressionRefs(obj):
+    refs = set()
+    for (prop, expr) in obj.ExpressionEngine:
+        for (docName, objName) in exprRefRegex.findall(expr):
+            if not docName:
+                docName = obj.Document.Name
+            refs.add( (docName, objName) )
+    return refs
+
+
+# all objects used by the native solver to place an object
+# returns a set of ( docName, objName )
+def nativeRefs(obj):
+    doc = obj.Document
+    refs = set()
+    (a_Link, sep, a_LCS) = obj.AttachedTo.partition('#')
+    if a_Link == 'Parent Assembly':
+        refs.add( (doc.Name, a_LCS) )
+    else:
+        refs.add( (doc.Name, a_Link) )
+        parent = doc.getObject(a_Link)
+        if parent and parent.LinkedObject:
+            refs.add( (parent.LinkedObject.Document.Name, a_LCS) )
+    if obj.AttachedBy != 'Origin' and hasattr(obj,'LinkedObject') and obj.LinkedObject:
+        refs.add( (obj.LinkedObject.Document.Name, obj.AttachedBy[1:]) )
+    # the other expressions of the object, like an AttachmentOffset bound to the Variables
+    refs |= expressionRefs(obj)
+    return refs
+
+
+# the dependency graph of all Asm4 nodes in a document
+# each node is an object name, and has the list of the objects it depends on:
+# - nodes are the names of objects in the document
+# - refs are the ( docName, objName ) of all referenced objects
+class dependencyGraph():
+    def __init__(self, doc):
+        self.doc = doc
+        # node -> nodes it depends on
+        self.parents = {}
+        # node -> nodes depending on it
+        self.children = {}
+        # node -> all ( docName, objName ) referenced
+        self.refs = {}
+        # the nodes in document order
+        self.nodes = []
+        for obj in doc.Objects:
+            if isSolverNode(obj):
+                self.nodes.append(obj.Name)
+                self.parents[obj.Name] = set()
+                self.children.setdefault(obj.Name, set())
+                if obj.SolverId == nativeSolverId:
+                    self.refs[obj.Name] = nativeRefs(obj)
+                else:
+                    self.refs[obj.Name] = expressionRefs(obj)
+                self.refs[obj.Name].add( (doc.Name, obj.Name) )
+        for name in self.nodes:
+            obj = doc.getObject(name)
+            deps = set()
+            parent = attachedParent(obj)
+            if parent in self.parents:
+                deps.add(parent)
+            for (docName, objName) in self.refs[name]:
+                if docName == doc.Name and objName in self.parents and objName != name:
+                    deps.add(objName)
+            self.parents[name] = deps
+            for dep in deps:
+                self.children[dep].add(name)
+
+    # all nodes affected by the changed ( docName, objName ) keys,
+    # including all their downstream dependents
+    def affected(self, changed):
+        seeds = [ name for name in self.nodes if self.refs[name] & changed ]
+        result = set(seeds)
+        while seeds:
+            name = seeds.pop()
+            for child in self.children[name]:
+                if child not in result:
+                    result.add(child)
+                    seeds.append(child)
+        return result
+
+    # the nodes and all the nodes they depend on, directly or not
+    def upstream(self, names):
+        result = set(names)
+        seeds = list(names)
+        while seeds:
+            name = seeds.pop()
+            for parent in self.parents[name]:
+                if parent not in result:
+                    result.add(parent)
+                    seeds.append(parent)
+        return result
+
+    # sort the nodes such that each node comes after the nodes it depends on
+    def topoSort(self, subset=None):
+        if subset is None:
+            subset = set(self.nodes)
+        # number of parents of each node inside the subset
+        nbParents = {}
+        for name in subset:
+            nbParents[name] = len( self.parents[name] & subset )
+        ready = deque( name for name in self.nodes if name in subset and nbParents[name]==0 )
+        order = []
+        while ready:
+            name = ready.popleft()
+            order.append(name)
+            for child in self.children[name]:
+                if child in nbParents:
+                    nbParents[child] -= 1
+                    if nbParents[child] == 0:
+                        ready.append(child)
+        # circular dependencies: append the rest in document order
+        if len(order) < len(subset):
+            FCC.PrintWarning('Circular dependencies found in the assembly, solving them in document order\n')
+            done = set(order)
+            for name in self.nodes:
+                if name in subset and name not in done:
+                    order.append(name)
+        return order
+
+    # group the sorted nodes by dependency level: nodes in a level
+    # only depend on nodes of the previous levels, or outside the subset
+    def levels(self, subset=None):
+        order = self.topoSort(subset)
+        inOrder = set(order)
+        level = {}
+        levels = []
+        for name in order:
+            parents = [ level[p] for p in self.parents[name] if p in inOrder and p in level ]
+            level[name] = max(parents)+1 if parents else 0
+            if level[name] == len(levels):
+                levels.append([])
+            levels[level[name]].append(name)
+        return levels
+
+
+
+"""
+    +-----------------------------------------------+
+    |                 native solver                 |
+    +-----------------------------------------------+
+"""
+# cache of datum Placements and their inverse, used by the native solver
+# entries are invalidated by the document observer when a datum moves
+class placementCache():
+    def __init__(self):
+        # ( docName, objName ) -> ( Placement, Placement.inverse() )
+        self.placements = {}
+        # ( docName, objName ) -> ( matrix, inverse matrix )
+        self.matrixCache = {}
+
+    def get(self, doc, name):
+        key = ( doc.Name, name )
+        if key not in self.placements:
+            obj = doc.getObject(name)
+            if obj is None:
+                return None
+            self.placements[key] = ( obj.Placement, obj.Placement.inverse() )
+        return self.placements[key]
+
+    # the same as above as 4x4 NumPy matrices, for the batch solver
+    def matrices(self, doc, name):
+        key = ( doc.Name, name )
+        if key not in self.matrixCache:
+            cached = self.get(doc, name)
+            if cached is None:
+                return None
+            self.matrixCache[key] = ( toArray(cached[0]), toArray(cached[1]) )
+        return self.matrixCache[key]
+
+    def placement(self, doc, name):
+        cached = self.get(doc, name)
+        return cached[0] if cached else None
+
+    def inverse(self, doc, name):
+        cached = self.get(doc, name)
+        return cached[1] if cached else None
+
+    def invalidate(self, obj):
+        self.placements.pop( (obj.Document.Name, obj.Name), None )
+        self.matrixCache.pop( (obj.Document.Name, obj.Name), None )
+
+    def clear(self):
+        self.placements = {}
+        self.matrixCache = {}
+
+
+lcsCache = placementCache()
+
+
+# computes the Placement of an object from its AttachedTo and AttachedBy properties,
+# this is the same chain as the expression built by Asm4_libs.makeExpressionPart:
+# [ParentLink.Placement *] LCS_parent.Placement * AttachmentOffset [* LCS_link.Placement ^ -1]
+# the multiplications are done in the same order as by the ExpressionEngine
+# returns None if an object in the chain is missing
+def nativePlacement(obj):
+    doc = obj.Document
+    (a_Link, sep, a_LCS) = obj.AttachedTo.partition('#')
+    # attached to an LCS in the parent assembly
+    if a_Link == 'Parent Assembly':
+        placement = lcsCache.placement(doc, a_LCS)
+    # attached to an LCS in a sister part
+    else:
+        parent = doc.getObject(a_Link)
+        if parent is None or parent.LinkedObject is None:
+            return None
+        attPla = lcsCache.placement(parent.LinkedObject.Document, a_LCS)
+        if attPla is None:
+            return None
+        placement = parent.Placement * attPla
+    if placement is None:
+        return None
+    placement = placement * obj.AttachmentOffset
+    # fasteners and datums are attached by their origin
+    if obj.AttachedBy != 'Origin':
+        if not hasattr(obj,'LinkedObject') or obj.LinkedObject is None:
+            return None
+        linkInv = lcsCache.inverse(obj.LinkedObject.Document, obj.AttachedBy[1:])
+        if linkInv is None:
+            return None
+        placement = placement * linkInv
+    return placement
+
+
+# the Placement of a native object has no expression, but its other properties can have some,
+# like an AttachmentOffset bound to the Variables: they are evaluated by recomputing the object
+def evaluateExpressions(obj):
+    if obj.ExpressionEngine:
+        obj.recompute()
+
+
+# apply the native solver to an object
+def solveNative(obj):
+    evaluateExpressions(obj)
+    placement = nativePlacement(obj)
+    if placement is None:
+        FCC.PrintWarning('Could not solve the placement of '+obj.Label+'\n')
+        return False
+    if obj.Placement != placement:
+        obj.Placement = placement
+    return True
+
+
+# convert an Asm4 object to the native solver: the Placement expression is removed
+def setNativeSolver(obj):
+    obj.setExpression('Placement', None)
+    obj.SolverId = nativeSolverId
+    return solveNative(obj)
+
+
+# update an object with its own solver
+def solveObject(obj):
+    if obj.SolverId == nativeSolverId:
+        solveNative(obj)
+    else:
+        obj.recompute()
+
+
+
+"""
+    +-----------------------------------------------+
+    |                 batch solver                  |
+    +-----------------------------------------------+
+"""
+identity = numpy.identity(4)
+
+# App.Placement -> 4x4 NumPy array
+def toArray(placement):
+    return numpy.array( placement.toMatrix().A ).reshape(4,4)
+
+# 4x4 NumPy array -> App.Placement
+def toPlacement(array):
+    return App.Placement( App.Matrix( *array.flatten().tolist() ) )
+
+
+# the matrices of the native placement chain of an object, see nativePlacement()
+# ParentLink * LCS_parent * AttachmentOffset * LCS_link^-1
+# solved contains the arrays of the objects solved in previous levels
+# returns None if an object in the chain is missing
+def nativeChain(obj, solved):
+    doc = obj.Document
+    (a_Link, sep, a_LCS) = obj.AttachedTo.partition('#')
+    if a_Link == 'Parent Assembly':
+        parentMat = identity
+        attMats = lcsCache.matrices(doc, a_LCS)
+    else:
+        parent = doc.getObject(a_Link)
+        if parent is None or parent.LinkedObject is None:
+            return None
+        if a_Link in solved:
+            parentMat = solved[a_Link]
+        else:
+            parentMat = toArray(parent.Placement)
+        attMats = lcsCache.matrices(parent.LinkedObject.Document, a_LCS)
+    if attMats is None:
+        return None
+    if obj.AttachedBy == 'Origin':
+        linkInv = identity
+    else:
+        if not hasattr(obj,'LinkedObject') or obj.LinkedObject is None:
+            return None
+        linkMats = lcsCache.matrices(obj.LinkedObject.Document, obj.AttachedBy[1:])
+        if linkMats is None:
+            return None
+        linkInv = linkMats[1]
+    return ( parentMat, attMats[0], toArray(obj.AttachmentOffset), linkInv )
+
+
+# solve a level of native objects, that don't depend on each other, in one go:
+# the chains are stacked in (N,4,4) arrays and multiplied together
+def solveNativeBatch(doc, names, solved):
+    objs = []
+    chains = []
+    for name in names:
+        obj = doc.getObject(name)
+        evaluateExpressions(obj)
+        chain = nativeChain(obj, solved)
+        if chain is None:
+            FCC.PrintWarning('Could not solve the placement of '+obj.Label+'\n')
+        else:
+            objs.append(obj)
+            chains.append(chain)
+    if not chains:
+        return
+    # shape (4,N,4,4): parent, attachment LCS, offset, inverse link LCS
+    stack = numpy.array(chains).transpose(1,0,2,3)
+    results = stack[0] @ stack[1] @ stack[2] @ stack[3]
+    # write back the results
+    for obj, result in zip(objs, results):
+        solved[obj.Name] = result
+        placement = toPlacement(result)
+        if obj.Placement != placement:
+            obj.Placement = placement
+
+
+# solve the nodes level by level: the native objects of each level
+# are solved in a batch, the others are recomputed one by one
+def solveLevels(doc, graph, subset=None):
+    solved = {}
+    for level in graph.levels(subset):
+        natives = []
+        for name in level:
+            obj = doc.getObject(name)
+            if obj.SolverId == nativeSolverId:
+                natives.append(name)
+            else:
+                obj.recompute()
+        solveNativeBatch(doc, natives, solved)
+
+
+
+"""
+    +-----------------------------------------------+
+    |            track the changed objects          |
+    +-----------------------------------------------+
+"""
+# document observer that records the changes since the last solve
+# of each tracked document. Objects in other documents are also
+# recorded, since they might be linked in a tracked assembly
+class dirtyTracker():
+    def __init__(self):
+        # docName -> set of changed ( docName, objName )
+        self.dirty = {}
+        # set during a solve to ignore the changes made by the solver
+        self.solving = False
+
+    def isTracked(self, doc):
+        return doc is not None and doc.Name in self.dirty
+
+    # start tracking a document, after it has been fully solved
+    def track(self, doc):
+        self.dirty[doc.Name] = set()
+
+    # stop tracking all documents
+    def untrack(self):
+        self.dirty = {}
+
+    def changed(self, doc):
+        return self.dirty.get(doc.Name, set())
+
+    def clear(self, doc):
+        if doc.Name in self.dirty:
+            self.dirty[doc.Name] = set()
+
+    def markDirty(self, obj):
+        if self.solving or not self.dirty:
+            return
+        key = ( obj.Document.Name, obj.Name )
+        for changed in self.dirty.values():
+            changed.add(key)
+
+    # document observer API
+    def slotChangedObject(self, obj, prop):
+        if prop == 'Placement':
+            lcsCache.invalidate(obj)
+        if prop in watchedProperties:
+            self.markDirty(obj)
+        # assembly Variables and datums can be used by any expression
+        elif obj.Name == 'Variables' or obj.TypeId in datumTypes:
+            self.markDirty(obj)
+
+    def slotDeletedObject(self, obj):
+        lcsCache.invalidate(obj)
+        self.markDirty(obj)
+
+    def slotDeletedDocument(self, doc):
+        lcsCache.clear()
+        if doc.Name in self.dirty:
+            del self.dirty[doc.Name]
+        # objects of the closed document might have been used anywhere
+        for name in self.dirty:
+            self.dirty[name].add( (doc.Name, '') )
+
+
+tracker = dirtyTracker()
+App.addDocumentObserver(tracker)
+
+
+# parameter observer that stops the tracking when the incremental solver is turned off
+class preferenceObserver():
+    def OnChange(self, group, name):
+        if name == 'IncrementalSolver' and not isIncremental():
+            tracker.untrack()
+
+
+preferences = getParameters()
+if preferences is not None:
+    preferenceWatcher = preferenceObserver()
+    preferences.Attach(preferenceWatcher)
+
+
+
+"""
+    +-----------------------------------------------+
+    |                 solve methods                 |
+    +-----------------------------------------------+
+"""
+# solve the nodes of a graph (all nodes if subset is None) in dependency order
+def solveNodes(doc, graph, subset=None):
+    if isBatch():
+        solveLevels(doc, graph, subset)
+    else:
+        for name in graph.topoSort(subset):
+            solveObject( doc.getObject(name) )
+
+
+# the original solve: recompute every App::Part in the document
+# objects placed by the native solver are updated first, in dependency order
+def solveFull(doc):
+    tracker.solving = True
+    try:
+        nativeNodes = [ obj for obj in doc.Objects if isSolverNode(obj) and obj.SolverId == nativeSolverId ]
+        if nativeNodes:
+            solveNodes( doc, dependencyGraph(doc) )
+        for obj in doc.Objects:
+            if obj.TypeId == 'App::Part':
+                obj.recompute('True')
+    finally:
+        tracker.solving = False
+    # the changes are only recorded for the incremental solver
+    if isIncremental():
+        tracker.track(doc)
+    else:
+        tracker.untrack()
+
+
+# recompute the given objects and their dependents, in dependency order,
+# for example after their AttachmentOffset has been changed by a script
+# returns the number of recomputed objects
+def solveObjects(objs):
+    byDoc = {}
+    for obj in objs:
+        byDoc.setdefault(obj.Document.Name, set()).add( (obj.Document.Name, obj.Name) )
+    nb = 0
+    tracker.solving = True
+    try:
+        for docName, changed in byDoc.items():
+            doc = App.getDocument(docName)
+            graph = dependencyGraph(doc)
+            affected = graph.affected(changed)
+            solveNodes(doc, graph, affected)
+            # objects that aren't placed by an Asm4 solver
+            for (docName, objName) in changed:
+                if objName not in graph.parents:
+                    doc.getObject(objName).recompute()
+                    nb += 1
+            nb += len(affected)
+    finally:
+        tracker.solving = False
+    return nb
+
+
+# recompute only the changed nodes and their dependents, in dependency order
+# returns the number of recomputed objects
+def solveIncremental(doc):
+    if not tracker.isTracked(doc):
+        solveFull(doc)
+        return None
+    changed = tracker.changed(doc)
+    # a closed document: we don't know who used it
+    for (docName, objName) in changed:
+        if objName == '':
+            solveFull(doc)
+            return None
+    graph = dependencyGraph(doc)
+    affected = graph.affected(changed)
+    tracker.solving = True
+    try:
+        solveNodes(doc, graph, affected)
+    finally:
+        tracker.solving = False
+    tracker.clear(doc)
+    return len(affected)
+
+
+
+"""
+    +-----------------------------------------------+
+    |      solve the native objects on recompute    |
+    +-----------------------------------------------+
+"""
+# document observer that solves the native objects before each recompute of their document,
+# so that they follow the Variables and the animations like the ExpressionEngine objects:
+# the objects they depend on are recomputed first, the others are left to the document
+class nativeUpdater():
+    def slotBeforeRecomputeDocument(self, doc):
+        # the solver recomputes objects itself
+        if tracker.solving:
+            return
+        natives = [ obj.Name for obj in doc.Objects if isSolverNode(obj) and obj.SolverId == nativeSolverId ]
+        if not natives:
+            return
+        graph = dependencyGraph(doc)
+        tracker.solving = True
+        try:
+            solveNodes( doc, graph, graph.upstream(natives) )
+        finally:
+            tracker.solving = False
+
+
+updater = nativeUpdater()
+App.addDocumentObserver(updater)
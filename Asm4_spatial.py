@@ -0,0 +1,394 @@
+#!/usr/bin/env python3
+# coding: utf-8
+#
+# LGPL
+#
+# Asm4_spatial.py
+#
+# a spatial index of shapes for the measure tool of the Assembly 4 workbench
+# each shape is sampled once (tessellated faces, discretized edges, vertices)
+# and its samples are stored in a bounding-box tree, which gives quickly
+# an upper bound of the distance between 2 shapes and the nearest snap points
+# the exact distance is then computed by OCC (distToShape) only between
+# the faces, edges or vertices which can be closer than this bound
+# this file doesn't depend on the GUI and can be used from FreeCADCmd:
+#
+# import Part, Asm4_spatial
+# (dist, pt1, pt2) = Asm4_spatial.shapeDistance( Part.makeBox(10,10,10), Part.makeSphere(2, App.Vector(20,0,0)) )
+
+
+
+import heapq
+from collections import OrderedDict
+
+import numpy
+
+import FreeCAD as App
+
+
+
+"""
+    +-----------------------------------------------+
+    |                   settings                    |
+    +-----------------------------------------------+
+"""
+# the sampling deflection, relative to the size of the shape
+meshResolution = 0.005
+# number of samples in the leaves of the tree
+leafSize = 32
+# number of shapes kept for each document
+cacheSize = 64
+# shapes larger than this are infinite datum objects
+infiniteSize = 1.0e+10
+
+
+
+"""
+    +-----------------------------------------------+
+    |               Helper functions                |
+    +-----------------------------------------------+
+"""
+# a bounding box as [ XMin, YMin, ZMin, XMax, YMax, ZMax ]
+def boxArray(box):
+    return numpy.array( [ box.XMin, box.YMin, box.ZMin, box.XMax, box.YMax, box.ZMax ] )
+
+
+# the distances between the boxes (N,6) and the boxes (M,6), as an array (N,M)
+# boxes that overlap are at distance 0
+def boxDistances(boxes1, boxes2):
+    gap = numpy.maximum( boxes1[:,None,:3] - boxes2[None,:,3:], boxes2[None,:,:3] - boxes1[:,None,3:] )
+    gap = numpy.maximum(gap, 0.0)
+    return numpy.sqrt( numpy.einsum('ijk,ijk->ij', gap, gap) )
+
+
+# the faces, edges and vertices of a shape, which are measured with OCC
+# solids and shells are measured by their faces, wires by their edges
+def elements(shape):
+    if shape.ShapeType in ('Compound', 'CompSolid'):
+        result = []
+        for child in shape.childShapes():
+            result.extend( elements(child) )
+        return result
+    elif shape.ShapeType in ('Solid', 'Shell', 'Face'):
+        return shape.Faces
+    elif shape.ShapeType in ('Wire', 'Edge'):
+        return shape.Edges
+    return [ shape ]
+
+
+# points on an element: the nodes of the tessellation of a face,
+# the discretization of an edge, or the point of a vertex
+def samples(element, deflection):
+    points = []
+    try:
+        if element.ShapeType == 'Face':
+            points = element.tessellate(deflection)[0]
+        elif element.ShapeType == 'Edge':
+            points = element.discretize(Deflection=deflection)
+    except Exception:
+        points = []
+    # the vertices are always on the element
+    if not points:
+        points = [ v.Point for v in element.Vertexes ]
+    return [ (p.x, p.y, p.z) for p in points ]
+
+
+# the snap points of an element: its vertices, the middle of its edges
+# and the center of its circles, with their kind
+def snapPoints(element):
+    points = []
+    for vertex in element.Vertexes:
+        points.append( ( vertex.Point, 'Vertex' ) )
+    for edge in element.Edges:
+        if hasattr(edge,'Curve') and edge.Curve.TypeId=='Part::GeomCircle':
+            points.append( ( edge.Curve.Center, 'Center' ) )
+        if edge.Length > 0:
+            points.append( ( edge.valueAt( (edge.FirstParameter+edge.LastParameter)/2 ), 'Middle' ) )
+    if element.ShapeType == 'Face':
+        points.append( ( element.BoundBox.Center, 'Center' ) )
+    return points
+
+
+
+"""
+    +-----------------------------------------------+
+    |            the bounding-box tree              |
+    +-----------------------------------------------+
+"""
+# the points are split at the median of the longest side of their box,
+# until there are at most leafSize points in a node
+# a leaf is the range [ start, end [ of the sorted points
+class pointTree():
+    def __init__(self, points, tags=None):
+        points = numpy.asarray(points, dtype=float).reshape(-1,3)
+        if tags is None:
+            tags = numpy.arange(len(points))
+        order = numpy.arange(len(points))
+        self.lo    = []
+        self.hi    = []
+        self.start = []
+        self.end   = []
+        self.left  = []
+        self.right = []
+        if len(points):
+            stack = [ ( 0, len(points), -1, False ) ]
+            while stack:
+                (start, end, parent, isRight) = stack.pop()
+                node = len(self.lo)
+                if parent >= 0:
+                    if isRight:
+                        self.right[parent] = node
+                    else:
+                        self.left[parent] = node
+                subset = points[ order[start:end] ]
+                lo = subset.min(axis=0)
+                hi = subset.max(axis=0)
+                self.lo.append(lo)
+                self.hi.append(hi)
+                self.start.append(start)
+                self.end.append(end)
+                self.left.append(-1)
+                self.right.append(-1)
+                if end-start > leafSize:
+                    axis = int( numpy.argmax(hi-lo) )
+                    middle = (end-start)//2
+                    split = numpy.argpartition( subset[:,axis], middle )
+                    order[start:end] = order[start:end][split]
+                    stack.append( ( start, start+middle, node, False ) )
+                    stack.append( ( start+middle, end, node, True ) )
+        self.points = points[order]
+        self.tags   = numpy.asarray(tags)[order]
+        self.lo     = numpy.array(self.lo).reshape(-1,3)
+        self.hi     = numpy.array(self.hi).reshape(-1,3)
+
+    def isEmpty(self):
+        return len(self.points) == 0
+
+    def isLeaf(self, node):
+        return self.left[node] < 0
+
+    def size(self, node):
+        return self.end[node] - self.start[node]
+
+    # the distance between the boxes of a node of this tree and a node of another tree
+    def nodeDistance(self, node, other, otherNode):
+        gap = numpy.maximum( self.lo[node] - other.hi[otherNode], other.lo[otherNode] - self.hi[node] )
+        gap = numpy.maximum(gap, 0.0)
+        return float( numpy.sqrt( gap.dot(gap) ) )
+
+    # the distance between the box of a node and a point
+    def pointDistance(self, node, point):
+        gap = numpy.maximum( self.lo[node] - point, point - self.hi[node] )
+        gap = numpy.maximum(gap, 0.0)
+        return float( numpy.sqrt( gap.dot(gap) ) )
+
+    # the sample nearest to a point, as ( distance, index )
+    def nearest(self, point):
+        point = numpy.asarray(point, dtype=float)
+        best = ( numpy.inf, -1 )
+        if self.isEmpty():
+            return best
+        heap = [ ( self.pointDistance(0, point), 0 ) ]
+        while heap:
+            (bound, node) = heapq.heappop(heap)
+            if bound >= best[0]:
+                break
+            if self.isLeaf(node):
+                delta = self.points[ self.start[node]:self.end[node] ] - point
+                dist = numpy.einsum('ij,ij->i', delta, delta)
+                i = int( numpy.argmin(dist) )
+                if numpy.sqrt(dist[i]) < best[0]:
+                    best = ( float(numpy.sqrt(dist[i])), self.start[node]+i )
+            else:
+                for child in ( self.left[node], self.right[node] ):
+                    heapq.heappush( heap, ( self.pointDistance(child, point), child ) )
+        return best
+
+    # the closest pair of samples of 2 trees, as ( distance, index, otherIndex )
+    # the pairs of nodes are visited by increasing distance of their boxes,
+    # and the larger node of a pair is split until both are leaves
+    def closestPair(self, other):
+        best = ( numpy.inf, -1, -1 )
+        if self.isEmpty() or other.isEmpty():
+            return best
+        heap = [ ( self.nodeDistance(0, other, 0), 0, 0 ) ]
+        while heap:
+            (bound, node, otherNode) = heapq.heappop(heap)
+            if bound >= best[0]:
+                break
+            leaf = self.isLeaf(node)
+            otherLeaf = other.isLeaf(otherNode)
+            if leaf and otherLeaf:
+                pts = self.points[ self.start[node]:self.end[node] ]
+                otherPts = other.points[ other.start[otherNode]:other.end[otherNode] ]
+                delta = pts[:,None,:] - otherPts[None,:,:]
+                dist = numpy.einsum('ijk,ijk->ij', delta, delta)
+                (i, j) = numpy.unravel_index( numpy.argmin(dist), dist.shape )
+                if numpy.sqrt(dist[i,j]) < best[0]:
+                    best = ( float(numpy.sqrt(dist[i,j])), self.start[node]+int(i), other.start[otherNode]+int(j) )
+            elif otherLeaf or ( not leaf and self.size(node) >= other.size(otherNode) ):
+                for child in ( self.left[node], self.right[node] ):
+                    dist = self.nodeDistance(child, other, otherNode)
+                    if dist < best[0]:
+                        heapq.heappush( heap, ( dist, child, otherNode ) )
+            else:
+                for child in ( other.left[otherNode], other.right[otherNode] ):
+                    dist = self.nodeDistance(node, other, child)
+                    if dist < best[0]:
+                        heapq.heappush( heap, ( dist, node, child ) )
+        return best
+
+
+
+"""
+    +-----------------------------------------------+
+    |              the index of a shape             |
+    +-----------------------------------------------+
+"""
+# the samples of a shape in a tree, tagged with the element they are on,
+# and the bounding boxes of its elements
+class shapeIndex():
+    def __init__(self, shape, resolution=meshResolution):
+        self.shape = shape
+        self.elements = elements(shape)
+        self.boxes = numpy.array( [ boxArray(e.BoundBox) for e in self.elements ] ).reshape(-1,6)
+        size = shape.BoundBox.DiagonalLength
+        self.deflection = max( size*resolution, 1.0e-3 )
+        points = []
+        tags = []
+        for (i, element) in enumerate(self.elements):
+            pts = samples(element, self.deflection)
+            points.extend(pts)
+            tags.extend( [i]*len(pts) )
+        self.tree = pointTree(points, tags)
+        self.solids = shape.Solids if shape.ShapeType in ('Solid', 'CompSolid', 'Compound') else []
+        # snap points, built when first needed
+        self.snapTree = None
+        self.snapKinds = []
+
+    def isInfinite(self):
+        return self.shape.BoundBox.DiagonalLength > infiniteSize
+
+    # the nearest snap point to a position, as ( App.Vector, kind )
+    def snap(self, position):
+        if self.snapTree is None:
+            snaps = snapPoints(self.shape)
+            self.snapTree = pointTree( [ (p.x, p.y, p.z) for (p, kind) in snaps ] )
+            self.snapKinds = [ kind for (p, kind) in snaps ]
+        (dist, i) = self.snapTree.nearest( (position.x, position.y, position.z) )
+        if i < 0:
+            return ( None, None )
+        return ( App.Vector( *self.snapTree.points[i] ), self.snapKinds[ self.snapTree.tags[i] ] )
+
+    # whether a point is inside one of the solids of the shape
+    def isInside(self, point):
+        for solid in self.solids:
+            if solid.isInside( point, self.deflection*1.0e-3, True ):
+                return True
+        return False
+
+
+
+"""
+    +-----------------------------------------------+
+    |                  the cache                    |
+    +-----------------------------------------------+
+"""
+# the indexes of the last measured shapes, for each document
+# a shape is identified by its TShape and location (hashCode),
+# its type and its bounding box, a recomputed shape gets a new index
+class shapeCacheObserver():
+    def __init__(self):
+        # docName -> OrderedDict( key -> shapeIndex )
+        self.cache = {}
+
+    def key(self, shape):
+        box = shape.BoundBox
+        return ( shape.hashCode(), shape.ShapeType, len(shape.Faces), len(shape.Edges),
+                 box.XMin, box.YMin, box.ZMin, box.XMax, box.YMax, box.ZMax )
+
+    def get(self, shape, docName=None):
+        if docName is None:
+            docName = App.ActiveDocument.Name if App.ActiveDocument else ''
+        indexes = self.cache.setdefault( docName, OrderedDict() )
+        key = self.key(shape)
+        if key in indexes:
+            indexes.move_to_end(key)
+        else:
+            indexes[key] = shapeIndex(shape)
+            while len(indexes) > cacheSize:
+                indexes.popitem(last=False)
+        return indexes[key]
+
+    def clear(self, docName=None):
+        if docName is None:
+            self.cache.clear()
+        else:
+            self.cache.pop(docName, None)
+
+    # document observer API
+    def slotDeletedDocument(self, doc):
+        self.clear(doc.Name)
+
+
+shapeCache = shapeCacheObserver()
+App.addDocumentObserver(shapeCache)
+
+
+
+"""
+    +-----------------------------------------------+
+    |                 the measures                  |
+    +-----------------------------------------------+
+"""
+# the minimum distance between 2 shapes, as ( distance, point1, point2 )
+# the closest samples give an upper bound of the distance, then OCC measures
+# only the pairs of elements whose boxes are closer than this bound
+def shapeDistance(shape1, shape2, docName=None):
+    index1 = shapeCache.get(shape1, docName)
+    index2 = shapeCache.get(shape2, docName)
+    # infinite datum objects can't be sampled
+    if index1.isInfinite() or index2.isInfinite() or index1.tree.isEmpty() or index2.tree.isEmpty():
+        return occDistance(shape1, shape2)
+    # a shape inside a solid of the other: if it isn't completely inside,
+    # their boundaries intersect and the distance is found below
+    for (index, other) in ( (index1, index2), (index2, index1) ):
+        if index.solids:
+            point = App.Vector( *other.tree.points[0] )
+            if index.isInside(point):
+                return ( 0.0, point, point )
+    (bound, i, j) = index1.tree.closestPair(index2.tree)
+    # only the elements that can be closer than the bound
+    bound = bound*(1.0+1.0e-9) + 1.0e-9
+    root1 = boxArray(shape1.BoundBox)[None,:]
+    root2 = boxArray(shape2.BoundBox)[None,:]
+    near1 = numpy.flatnonzero( boxDistances(index1.boxes, root2)[:,0] <= bound )
+    near2 = numpy.flatnonzero( boxDistances(index2.boxes, root1)[:,0] <= bound )
+    dist = boxDistances( index1.boxes[near1], index2.boxes[near2] )
+    (rows, cols) = numpy.nonzero( dist <= bound )
+    order = numpy.argsort( dist[rows, cols], kind='stable' )
+    best = None
+    for k in order:
+        if dist[ rows[k], cols[k] ] > bound:
+            break
+        e1 = index1.elements[ near1[rows[k]] ]
+        e2 = index2.elements[ near2[cols[k]] ]
+        measure = e1.distToShape(e2)
+        if best is None or measure[0] < best[0]:
+            best = ( measure[0], measure[1][0][0], measure[1][0][1] )
+            bound = min( bound, measure[0] )
+    if best is None:
+        return occDistance(shape1, shape2)
+    return best
+
+
+# the distance by OCC between the complete shapes
+def occDistance(shape1, shape2):
+    measure = shape1.distToShape(shape2)
+    return ( measure[0], measure[1][0][0], measure[1][0][1] )
+
+
+# the snap point of a shape nearest to a position: vertices, middle of edges
+# and centers of circles and faces, as ( App.Vector, kind )
+def snapPoint(shape, position, docName=None):
+    return shapeCache.get(shape, docName).snap(position)
@@ -84,8 +84,15 @@ class cloneFastenersToAxesCmd():
     def Activated(self):
         (fstnr, axes) = self.selection
         if fstnr.Document:
+            # the axes where the fastener or one of its clones is already attached
+            attached = set()
+            for placed in [fstnr] + Asm4.findObjectLinks(fstnr, fstnr.Document):
+                if hasattr(placed, 'AttachedTo'):
+                    attached.add(placed.AttachedTo)
             for axisData in axes:
                 if len(axisData) > 3: # DocName/ModelName/AppLinkName/AxisName
+                    if axisData[2]+'#'+axisData[3] in attached:
+                        continue
                     docName = axisData[0]
                     doc = App.getDocument(docName)
                     if doc:
@@ -101,7 +108,7 @@ class cloneFastenersToAxesCmd():
                                     
             Gui.Selection.clearSelection()
             self.rootAssembly = Asm4.getAssembly()
-            if rootAssembly:
+            if self.rootAssembly:
                 Gui.Selection.addSelection( fstnr.Document.Name, self.rootAssembly.Name, fstnr.Name +'.')
 
 
@@ -8,7 +8,6 @@
 import os, json
 
 import FreeCAD as App
-import infoPartCmd
 
 
 # Autofilling info ref
@@ -49,198 +48,194 @@ except :
     file.close()
     
 
+### encode / decode the field names of the user configuration
+def writeXml(text):
+    text=text.encode('unicode_escape').decode().replace('\\','_x_m_l_')
+    return text
+
+def decodeXml(text):
+    text=text.replace('_x_m_l_','\\').encode().decode('unicode_escape')
+    return text
+
+
 ### now user configuration is :
 file = open(ConfUserFilejson, 'r')
 infoKeysUser = json.load(file).copy()
 file.close()
+infoKeysUserTime = os.path.getmtime(ConfUserFilejson)
 
-def infoDefault(self):
-    ### auto filling module
-    ### load infoKeysUser    
-    file = open(ConfUserFilejson, 'r')
-    infoKeysUser = json.load(file).copy()
-    file.close()
-    ### part variable creation
-    try :
-        self.TypeId
-        PART=self
-    except AttributeError:
-        PART=self.part
-    ### you have PART    
-    DOC=PART.Document
-    ### you have DOC
-    ### research
-    for i in range(len(PART.Group)):
-        if PART.Group[i].TypeId == 'PartDesign::Body' :
-            BODY=PART.Group[i]
-            ### you have BODY
-            for i in range(len(BODY.Group)):
-                if BODY.Group[i].TypeId == 'PartDesign::Pad' :
-                    PAD=BODY.Group[i]
-                    ### you have PAD
-                    try :
-                        SKETCH=PAD.Profile[0]
-                        ### you have SKETCH
-                    except NameError :
-                        print('there is no Sketch on a Pad of : ',PART.FullName )
-
-    ### start all autoinfofield
-    try :
-        LabelDoc(self,PART,DOC)
-    except NameError :
-        print('there is no DOC for this part : ',PART.FullName )
-    try :
-        LabelPart(self,PART)
-    except NameError :
-        print('there is no Part' )
-    try :    
-        PadLength(self,PART,PAD)
-    except NameError :
-        print('there is no PAD for this Part : ',PART.FullName )
-    try :
-        ShapeLength(self,PART,SKETCH)
-    except NameError :
-        print('ShapeLength : there is no Sketch for this Part : ',PART.FullName )
-    try :
-        ShapeVolume(self,PART,BODY)
-    except:
-        print('there is no Shape on Volume : ',PART.FullName )
-
-
-def ShapeVolume(self,PART, BODY):
-###you can use DOC - PART - BODY - PAD - SKETCH
-    auto_info_field = infoKeysUser.get('ShapeVolume').get('userData')
-    bbc = BODY.Shape.BoundBox
-    auto_info_fill = str(round(bbc.ZLength,3)) +str(' mm x ')+ str(round(bbc.YLength,3)) +str(' mm x ')+ str(round(bbc.XLength,3))+str(' mm')
+### the user configuration is read again only if the file has changed
+def loadInfoKeysUser():
+    global infoKeysUser, infoKeysUserTime
     try:
-        ### if the command comes from makeBom write autoinfo directly on Part
-        self.TypeId
-        setattr(PART,auto_info_field,str(auto_info_fill))
-    except AttributeError:
-        ### if the command comes from infoPartUI write autoinfo on autofilling field on UI
-        try :
-        ### if field is active
-            for i in range(len(self.infoTable)):
-                if self.infoTable[i][0]== auto_info_field :
-                    self.infos[i].setText(str(auto_info_fill))
-        except AttributeError:
-        ### if field is not active
-            pass
+        mtime = os.path.getmtime(ConfUserFilejson)
+    except OSError:
+        return infoKeysUser
+    if mtime != infoKeysUserTime:
+        file = open(ConfUserFilejson, 'r')
+        infoKeysUser = json.load(file).copy()
+        file.close()
+        infoKeysUserTime = mtime
+    return infoKeysUser
+
+### add the active part information fields to a part
+### (used by the BOM and by the "Edit Part Information" command)
+def makePartInfo( part, infoKeysUser ):
+    for info in infoKeysUser:
+        if infoKeysUser.get(info).get('active'):
+            if not hasattr(part,infoKeysUser.get(info).get('userData')):
+                part.addProperty( 'App::PropertyString', infoKeysUser.get(info).get('userData'), 'PartInfo' )
+    return
 
 
 """
 how make a new autoinfofield :
 
-ref newautoinfofield name in partInfo[]
+write a provider function that takes the autoInfoContext of the part,
+and returns the value of the field (or None if it can't be computed):
 
-make a description in infoToolTip = {}
+def newautoinfofieldname(ctx):
+###you can use ctx.DOC - ctx.PART - ctx.BODY - ctx.PAD - ctx.SKETCH - ctx.BoundBox()
+    return newautoinfofield information
 
-put newautoinfofield name in infoDefault() at the end with the right arg (PAD,SKETCH...)
+and register it, with a description for the tooltip :
 
-write new def like that :
-
-def newautoinfofieldname(self,PART(option : DOC , BODY , PAD , SKETCH):
-###you can use DOC - PART - BODY - PAD - SKETCH
-    auto_info_field = infoKeysUser.get('newautoinfofieldname').get('userData')
-    auto_info_fill = newautoinfofield information
-    try:
-        ### if the command comes from makeBom write autoinfo directly on Part
-        self.TypeId
-        setattr(PART,auto_info_field,str(auto_info_fill))
-    except AttributeError:
-        ### if the command comes from infoPartUI write autoinfo on autofilling field on UI
-        try :
-        ### if field is active
-            for i in range(len(self.infoTable)):
-                if self.infoTable[i][0]== auto_info_field :
-                    self.infos[i].setText(str(auto_info_fill))
-        except AttributeError:
-        ### if field is not active
-            pass
+registerAutoField('newautoinfofieldname', newautoinfofieldname, 'Return the ...')
 
+this adds the field to partInfo[] and infoToolTip{}
 """
 
-def ShapeLength(self,PART,SKETCH):
-###you can use DOC - PART - BODY - PAD - SKETCH
-    auto_info_field = infoKeysUser.get('ShapeLength').get('userData')
-    try :
-        auto_info_fill = SKETCH.Shape.Length
-    except AttributeError:
-        return
-    try:
-        ### if the command comes from makeBom write autoinfo directly on Part
-        self.TypeId
-        setattr(PART,auto_info_field,str(auto_info_fill))
-    except AttributeError:
-        ### if the command comes from infoPartUI write autoinfo on autofilling field on UI
-        try :
-        ### if field is active
-            for i in range(len(self.infoTable)):
-                if self.infoTable[i][0]== auto_info_field :
-                    self.infos[i].setText(str(auto_info_fill))
-        except AttributeError:
-        ### if field is not active
-            pass
-            
-
-def PadLength(self,PART,PAD):
-###you can use DOC - PART - BODY - PAD - SKETCH
-    auto_info_field = infoKeysUser.get('PadLength').get('userData')
-    try :
-        auto_info_fill = str(PAD.Length).replace('mm','')
-    except AttributeError:
-        return
-    try:
-        ### if the command comes from makeBom write autoinfo directly on Part
-        self.TypeId
-        setattr(PART,auto_info_field,str(auto_info_fill))
-    except AttributeError:
-        ### if the command comes from infoPartUI write autoinfo on autofilling field on UI
+### the registered auto fields: name -> provider
+autoFields = dict()
+
+### ( docName, partName ) -> ( stamp, { field name: value } )
+autoInfoCache = dict()
+
+def registerAutoField(name, provider, toolTip=''):
+    autoFields[name] = provider
+    if name not in partInfo:
+        partInfo.append(name)
+    infoToolTip[name] = toolTip
+    autoInfoCache.clear()
+
+
+### everything the providers can use, found in a single pass over the part
+class autoInfoContext():
+    def __init__(self, PART):
+        self.PART = PART
+        self.DOC = PART.Document
+        self.BODY = None
+        self.PAD = None
+        self.SKETCH = None
+        self.boundBox = None
+        ### research, the last Body, Pad and Sketch found are kept
+        for obj in PART.Group:
+            if obj.TypeId == 'PartDesign::Body' :
+                self.BODY = obj
+                for feature in obj.Group:
+                    if feature.TypeId == 'PartDesign::Pad' :
+                        self.PAD = feature
+                        if feature.Profile:
+                            self.SKETCH = feature.Profile[0]
+
+    ### the bounding box of the Body, computed once for all providers
+    def BoundBox(self):
+        if self.boundBox is None and self.BODY is not None:
+            self.boundBox = self.BODY.Shape.BoundBox
+        return self.boundBox
+
+    ### changes when the labels or the shapes of the part change
+    def stamp(self):
+        stamp = [ self.DOC.Label, self.PART.Label ]
+        for obj in [ self.BODY, self.PAD, self.SKETCH ]:
+            if obj is not None and hasattr(obj,'Shape'):
+                stamp.append( obj.Shape.hashCode() )
+            else:
+                stamp.append( None )
+        return tuple(stamp)
+
+
+### all auto fields of a part, computed in one pass and cached
+def autoInfo(PART):
+    ctx = autoInfoContext(PART)
+    key = ( PART.Document.Name, PART.Name )
+    stamp = ctx.stamp()
+    cached = autoInfoCache.get(key)
+    if cached and cached[0] == stamp:
+        return cached[1]
+    values = dict()
+    for name, provider in autoFields.items():
         try :
-        ### if field is active
-            for i in range(len(self.infoTable)):
-                if self.infoTable[i][0]== auto_info_field :
-                    self.infos[i].setText(str(auto_info_fill))
-        except AttributeError:
-        ### if field is not active
-            pass
+            value = provider(ctx)
+        except Exception as err:
+            print('auto-info field ',name,' failed for : ',PART.FullName,' ',err )
+            value = None
+        if value is not None:
+            values[name] = str(value)
+    autoInfoCache[key] = ( stamp, values )
+    return values
 
 
-        
-def LabelDoc(self,PART,DOC):
-    docLabel = infoKeysUser.get('LabelDoc').get('userData')
-    try:
-        ### if the command comes from makeBom write autoinfo directly on Part
-        self.TypeId
-        setattr(PART,docLabel,DOC.Label)
-    except AttributeError:
-        ### if the command comes from infoPartUI write autoinfo on autofilling field on UI
-        try :
-        ### if field is active
-            for i in range(len(self.infoTable)):
-                if self.infoTable[i][0]==docLabel:
-                    self.infos[i].setText(DOC.Label)
-        except AttributeError:
-        ### if field is not active
-            pass
-        
-def LabelPart(self,PART):
-    partLabel = infoKeysUser.get('LabelPart').get('userData')
-    try:
-        ### if the command comes from makeBom write autoinfo directly on Part
+def infoDefault(self):
+    ### auto filling module
+    ### load infoKeysUser
+    infoKeysUser = loadInfoKeysUser()
+    ### part variable creation
+    try :
         self.TypeId
-        setattr(PART,partLabel,PART.Label)
+        PART=self
     except AttributeError:
-        ### if the command comes from infoPartUI write autoinfo on autofilling field on UI
-        try :
-        ### if field is active
-            for i in range(len(self.infoTable)):
-                if self.infoTable[i][0]== partLabel:
-                    self.infos[i].setText(PART.Label)
+        PART=self.part
+    ### compute all auto fields at once
+    values = autoInfo(PART)
+    for name, value in values.items():
+        if infoKeysUser.get(name) is None:
+            continue
+        auto_info_field = infoKeysUser.get(name).get('userData')
+        try:
+            ### if the command comes from makeBom write autoinfo directly on Part
+            self.TypeId
+            if hasattr(PART,auto_info_field):
+                setattr(PART,auto_info_field,value)
         except AttributeError:
-        ### if field is not active
-            pass
-
-
-    
-    pass
\ No newline at end of file
+            ### if the command comes from infoPartUI write autoinfo on autofilling field on UI
+            try :
+            ### if field is active
+                for i in range(len(self.infoTable)):
+                    if self.infoTable[i][0]== auto_info_field :
+                        self.infos[i].setText(value)
+            except AttributeError:
+            ### if field is not active
+                pass
+
+
+### the default auto fields
+###you can use DOC - PART - BODY - PAD - SKETCH
+def LabelDoc(ctx):
+    return ctx.DOC.Label
+
+def LabelPart(ctx):
+    return ctx.PART.Label
+
+def PadLength(ctx):
+    if ctx.PAD is None:
+        return None
+    return str(ctx.PAD.Length).replace('mm','')
+
+def ShapeLength(ctx):
+    if ctx.SKETCH is None:
+        return None
+    return ctx.SKETCH.Shape.Length
+
+def ShapeVolume(ctx):
+    bbc = ctx.BoundBox()
+    if bbc is None:
+        return None
+    return str(round(bbc.ZLength,3)) +str(' mm x ')+ str(round(bbc.YLength,3)) +str(' mm x ')+ str(round(bbc.XLength,3))+str(' mm')
+
+
+registerAutoField( 'LabelDoc',    LabelDoc,    infoToolTip['LabelDoc'] )
+registerAutoField( 'LabelPart',   LabelPart,   infoToolTip['LabelPart'] )
+registerAutoField( 'PadLength',   PadLength,   infoToolTip['PadLength'] )
+registerAutoField( 'ShapeLength', ShapeLength, infoToolTip['ShapeLength'] )
+registerAutoField( 'ShapeVolume', ShapeVolume, infoToolTip['ShapeVolume'] )
@@ -6,7 +6,7 @@
 # The code to save and restore configurations, using spreadsheets
 
 
-import os, re
+import os, re, json
 
 from PySide import QtGui, QtCore
 import FreeCADGui as Gui
@@ -14,6 +14,7 @@ import FreeCAD as App
 from FreeCAD import Console as FCC
 
 import Asm4_libs as Asm4
+import Asm4_solver
 
 ASM4_CONFIG_TYPE        = 'Asm4::ConfigurationTable'
 HEADER_CELL             = 'A1'
@@ -28,6 +29,14 @@ OFFSET_POS_Z_COL        = 'F'
 OFFSET_ROT_YAW_COL      = 'G'
 OFFSET_ROT_PITCH_COL    = 'H'
 OFFSET_ROT_ROLL_COL     = 'I'
+# the columns of an object's data, in the order of a record
+DATA_COLS               = [ OBJECT_VISIBLE_COL, OBJECT_ASM_TYPE_COL,
+                            OFFSET_POS_X_COL, OFFSET_POS_Y_COL, OFFSET_POS_Z_COL,
+                            OFFSET_ROT_YAW_COL, OFFSET_ROT_PITCH_COL, OFFSET_ROT_ROLL_COL ]
+HEADER_NAMES            = [ 'ObjectName', 'Visible', 'Assembly Type', 'Pos. X', 'Pos. Y', 'Pos. Z',
+                            'Rot. Yaw', 'Rot. Pitch', 'Rot. Roll' ]
+# the property of the configuration table holding the data in JSON format
+CONFIG_DATA_PROP        = 'ConfigurationData'
 
 
 
@@ -52,15 +61,8 @@ def createConfig(name, description):
     #conf.set(HEADER_CELL,           'Assembly4 configuration table')
     conf.set(HEADER_CELL,           ASM4_CONFIG_TYPE)
     conf.set(DESCRIPTION_CELL,      str(description))
-    conf.set(OBJECT_NAME_COL      + headerRow, 'ObjectName')
-    conf.set(OBJECT_VISIBLE_COL   + headerRow, 'Visible')
-    conf.set(OBJECT_ASM_TYPE_COL  + headerRow, 'Assembly Type')
-    conf.set(OFFSET_POS_X_COL     + headerRow, 'Pos. X')
-    conf.set(OFFSET_POS_Y_COL     + headerRow, 'Pos. Y')
-    conf.set(OFFSET_POS_Z_COL     + headerRow, 'Pos. Z')
-    conf.set(OFFSET_ROT_YAW_COL   + headerRow, 'Rot. Yaw')
-    conf.set(OFFSET_ROT_PITCH_COL + headerRow, 'Rot. Pitch')
-    conf.set(OFFSET_ROT_ROLL_COL  + headerRow, 'Rot. Roll')
+    for col, header in zip( [OBJECT_NAME_COL]+DATA_COLS, HEADER_NAMES ):
+        conf.set(col + headerRow, header)
     return conf
 
 
@@ -226,6 +228,8 @@ class openConfigurationsUI():
                     newItem = ListEntry(obj.Name)
                     newItem.setText(obj.Label)
                     self.configList.addItem(newItem)
+                    # decode it now, so that switching configurations is immediate
+                    configCache.get(obj)
 
 
     # defines the UI, only static elements
@@ -388,6 +392,182 @@ class newConfigurationCmd:
 
 
 
+"""
+    +-----------------------------------------------+
+    |        the data of a configuration table      |
+    +-----------------------------------------------+
+"""
+# a configuration table is read once into memory:
+# the objects' names in row order, with an index name -> position,
+# and a record for each object: [ Visible, AssemblyType, x, y, z, yaw, pitch, roll ]
+# (the offset is only stored for Asm4EE objects)
+# the data is written back in one operation, either as rows of the spreadsheet,
+# or as JSON in the CONFIG_DATA_PROP property of the spreadsheet
+class configTable():
+    def __init__(self, conf):
+        self.conf = conf
+        self.names = []
+        self.index = {}
+        self.records = {}
+        if conf is not None:
+            self.read()
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.index
+
+    # the record of an object, or None
+    def get(self, name):
+        return self.records.get(name)
+
+    # the row of an object in the spreadsheet, or None
+    def row(self, name):
+        if name in self.index:
+            return str( int(OBJECTS_START_ROW) + self.index[name] )
+        return None
+
+    def set(self, name, record):
+        if name not in self.index:
+            self.index[name] = len(self.names)
+            self.names.append(name)
+        self.records[name] = list(record)
+
+    def read(self):
+        data = getattr(self.conf, CONFIG_DATA_PROP, '')
+        if data:
+            self.readJSON(data)
+        else:
+            self.readSheet()
+
+    def readJSON(self, data):
+        try:
+            objects = json.loads(data).get('Objects', [])
+        except ValueError:
+            FCC.PrintWarning('Invalid data in configuration "'+self.conf.Label+'"\n')
+            return
+        for entry in objects:
+            self.set(entry[0], entry[1:])
+
+    # rows are read until the first empty name cell
+    def readSheet(self):
+        row = int(OBJECTS_START_ROW)
+        while True:
+            name = getCellValue(self.conf, OBJECT_NAME_COL + str(row))
+            if name is None or name == '':
+                break
+            record = [ str(getCellValue(self.conf, OBJECT_VISIBLE_COL + str(row)))=='True',
+                       str(getCellValue(self.conf, OBJECT_ASM_TYPE_COL + str(row))) ]
+            if record[1] == 'Asm4EE':
+                values = [ getCellValue(self.conf, col + str(row)) for col in DATA_COLS[2:] ]
+                if None not in values:
+                    record.extend( [ float(value) for value in values ] )
+            # old tables have each new object inserted on top, the first one is the valid one
+            if str(name) not in self.index:
+                self.set(str(name), record)
+            row += 1
+
+    # write the whole table back into the configuration
+    def write(self, description=None, asJSON=False):
+        conf = self.conf
+        if description is None:
+            description = getConfigDescription(conf)
+        headerRow = int(OBJECTS_START_ROW)-1
+        table = [ [ASM4_CONFIG_TYPE], [' '] ]
+        table.extend( [ [] for i in range(headerRow-len(table)-1) ] )
+        table.append(HEADER_NAMES)
+        if asJSON:
+            objects = [ [name] + self.records[name] for name in self.names ]
+            data = json.dumps( { 'Version': 1, 'Objects': objects }, separators=(',',':') )
+        else:
+            data = ''
+            for name in self.names:
+                table.append( [ name ] + [ str(value) for value in self.records[name] ] )
+        Asm4.writeSheet(conf, table)
+        # the description can have several lines
+        setConfigDescription(conf, description)
+        if data and not hasattr(conf, CONFIG_DATA_PROP):
+            conf.addProperty('App::PropertyString', CONFIG_DATA_PROP, 'Configuration')
+            conf.setEditorMode(CONFIG_DATA_PROP, 2)
+        if hasattr(conf, CONFIG_DATA_PROP):
+            setattr(conf, CONFIG_DATA_PROP, data)
+
+
+
+# a configuration decoded for restoring: for each object in row order
+# its visibility, its assembly type and its AttachmentOffset as an App.Placement
+# (None if the object has no stored offset)
+class configSnapshot():
+    def __init__(self, table):
+        self.conf = table.conf
+        self.names = list(table.names)
+        self.index = dict(table.index)
+        self.visible = []
+        self.asmTypes = []
+        self.offsets = []
+        for name in self.names:
+            record = table.get(name)
+            self.visible.append( bool(record[0]) )
+            self.asmTypes.append( record[1] )
+            offset = None
+            if len(record) == len(DATA_COLS):
+                x, y, z, yaw, pitch, roll = record[2:]
+                offset = App.Placement( App.Vector(x, y, z), App.Rotation(yaw, pitch, roll) )
+            self.offsets.append(offset)
+
+    # ( Visible, AssemblyType, offset ) of an object, or None
+    def get(self, name):
+        i = self.index.get(name)
+        if i is None:
+            return None
+        return ( self.visible[i], self.asmTypes[i], self.offsets[i] )
+
+
+# the decoded configurations, per document and configuration name
+# it's a document observer, an entry is dropped as soon as its spreadsheet changes
+class configCacheObserver():
+    def __init__(self):
+        # ( docName, confName ) -> configSnapshot
+        self.cache = {}
+
+    def get(self, conf):
+        key = ( conf.Document.Name, conf.Name )
+        if key not in self.cache:
+            self.cache[key] = configSnapshot( configTable(conf) )
+        return self.cache[key]
+
+    def invalidate(self, obj):
+        self.cache.pop( (obj.Document.Name, obj.Name), None )
+
+    def invalidateDocument(self, doc):
+        for key in [ key for key in self.cache if key[0]==doc.Name ]:
+            del self.cache[key]
+
+    # document observer API
+    def slotChangedObject(self, obj, prop):
+        if obj.TypeId == 'Spreadsheet::Sheet':
+            self.invalidate(obj)
+
+    def slotDeletedObject(self, obj):
+        if obj.TypeId == 'Spreadsheet::Sheet':
+            self.invalidate(obj)
+
+    def slotDeletedDocument(self, doc):
+        self.invalidateDocument(doc)
+
+    def slotUndoDocument(self, doc):
+        self.invalidateDocument(doc)
+
+    def slotRedoDocument(self, doc):
+        self.invalidateDocument(doc)
+
+
+configCache = configCacheObserver()
+App.addDocumentObserver(configCache)
+
+
+
 """
     +-----------------------------------------------+
     |         Save configuration functions          |
@@ -404,61 +584,47 @@ def SaveConfiguration(confName, description):
         if not confirm:
             FCC.PrintMessage('Cancel save of configuration "' + confName + '"\n')
             return
-        else:
-            setConfigDescription(conf, description)
     else:
         conf = createConfig(confName, description)
 
+    # the configuration is collected in memory and written in one go
+    table = configTable(conf)
     assy = Asm4.getAssembly()
     link  = Asm4.getSelectedLink()
     if link:
-        SaveObject(conf, link)
+        SaveObject(table, link)
     else:
-        SaveSubObjects(conf, assy)            
+        SaveSubObjects(table, assy)
+    table.write(description, asJSON=isJSON())
     conf.recompute(True)
 
 
-def SaveSubObjects(conf, container):
+def SaveSubObjects(table, container):
     for objName in container.getSubObjects():
         obj = container.getSubObject(objName, 1)
         # only save properties of objects that are derived from Part::Feature
         if obj.isDerivedFrom('Part::Feature'):
-            SaveObject(conf, obj)
+            SaveObject(table, obj)
 
 
-def SaveObject(conf, obj):
+def SaveObject(table, obj):
     # parse App::Part containers, and only those
     if obj.TypeId == 'App::Part':
-        SaveSubObjects(conf, obj)
+        SaveSubObjects(table, obj)
 
-    parentObj, objFullName = obj.Parents[0]
-    #objName = App.ActiveDocument.Name + '.' + parentObj.Name + '.' + objFullName
-    objName = parentObj.Name + '.' + objFullName[0:-1]
-
-    row = GetObjectRow(conf, objName)
-    if row is None:
-        conf.insertRows(OBJECTS_START_ROW, 1)
-        row = OBJECTS_START_ROW
-
-    conf.set( OBJECT_NAME_COL       + row,  objName )
-    conf.setAlias(OBJECT_NAME_COL   + row,  GetValidAlias(objName) )
+    objName = getObjectName(obj)
     # always store visibility info
-    conf.set( OBJECT_VISIBLE_COL    + row,  str(obj.ViewObject.Visibility) )
+    record = [ obj.ViewObject.Visibility ]
     # check how this object is assembled
     asmType = '-'
     if hasattr(obj,'AssemblyType'):
         asmType = obj.AssemblyType
-    conf.set( OBJECT_ASM_TYPE_COL       + row,  str(asmType) )
+    record.append( str(asmType) )
     if asmType == 'Asm4EE':
         offset = obj.AttachmentOffset
-        conf.set( OFFSET_POS_X_COL      + row,  str(offset.Base.x) )
-        conf.set( OFFSET_POS_Y_COL      + row,  str(offset.Base.y) )
-        conf.set( OFFSET_POS_Z_COL      + row,  str(offset.Base.z) )
-        conf.set( OFFSET_ROT_YAW_COL    + row,  str(offset.Rotation.toEuler()[0]) )
-        conf.set( OFFSET_ROT_PITCH_COL  + row,  str(offset.Rotation.toEuler()[1]) )
-        conf.set( OFFSET_ROT_ROLL_COL   + row,  str(offset.Rotation.toEuler()[2]) )
-
-
+        record.extend( [ offset.Base.x, offset.Base.y, offset.Base.z ] )
+        record.extend( offset.Rotation.toEuler() )
+    table.set(objName, record)
 
 
 
@@ -467,52 +633,48 @@ def SaveObject(conf, obj):
     |         Restore configuration functions       |
     +-----------------------------------------------+
 """
+# only the visibilities and offsets that differ from the configuration are set,
+# and only the objects whose offset changed are recomputed, with their dependents
 def restoreConfiguration(confName):
     FCC.PrintMessage('Restoring configuration "' + confName + '"\n')
     #doc = getConfig(confName, 'Configurations')
-    conf = getConfig(confName)
+    conf = configCache.get( getConfig(confName) )
     assy = Asm4.getAssembly()
     link = Asm4.getSelectedLink()
+    moved = []
     if link:
-        restoreObject(conf, link)
+        restoreObject(conf, link, moved)
     else:
-        restoreSubObjects(conf, assy)
-    App.ActiveDocument.recompute()
+        restoreSubObjects(conf, assy, moved)
+    if moved:
+        nb = Asm4_solver.solveObjects(moved)
+        FCC.PrintMessage(str(len(moved)) + ' offsets changed, ' + str(nb) + ' objects recomputed\n')
 
 # parse container
-def restoreSubObjects(conf, container):
+def restoreSubObjects(conf, container, moved):
     for objName in container.getSubObjects():
         obj = container.getSubObject(objName, 1)
-        restoreObject(conf, obj)
+        restoreObject(conf, obj, moved)
 
-def restoreObject(conf, obj):
+# the objects whose AttachmentOffset is changed are added to moved
+def restoreObject(conf, obj, moved):
     # parse App::Part containers, and only those
     if obj.TypeId == 'App::Part':
-        restoreSubObjects(conf, obj)
-
-    parentObj, objFullName = obj.Parents[0]
-    #objName = App.ActiveDocument.Name + '.' + parentObj.Name + '.' + objFullName
-    objName = parentObj.Name + '.' + objFullName
+        restoreSubObjects(conf, obj, moved)
 
-    row = GetObjectRow(conf, objName)
-    if row is None:
-        FCC.PrintMessage('No data for object "' + objName + '" in configuration "' + conf.Name + '"\n')
+    objName = getObjectName(obj)
+    entry = conf.get(objName)
+    if entry is None:
+        FCC.PrintMessage('No data for object "' + objName + '" in configuration "' + conf.conf.Name + '"\n')
         return
 
-    vis   = conf.get( OBJECT_VISIBLE_COL   + row )
-    obj.ViewObject.Visibility = (vis=='True')
-    asm   = str(conf.get( OBJECT_ASM_TYPE_COL  + row ))
-    if asm == 'Asm4EE':
-        x     = conf.get( OFFSET_POS_X_COL     + row )
-        y     = conf.get( OFFSET_POS_Y_COL     + row )
-        z     = conf.get( OFFSET_POS_Z_COL     + row )
-        yaw   = conf.get( OFFSET_ROT_YAW_COL   + row )
-        pitch = conf.get( OFFSET_ROT_PITCH_COL + row )
-        roll  = conf.get( OFFSET_ROT_ROLL_COL  + row )
-        position = App.Vector(x, y, z)
-        rotation = App.Rotation(yaw, pitch, roll)
-        offset = App.Placement(position, rotation)
-        obj.AttachmentOffset = offset
+    (vis, asm, offset) = entry
+    if obj.ViewObject.Visibility != vis:
+        obj.ViewObject.Visibility = vis
+    if asm == 'Asm4EE' and offset is not None:
+        if not isSamePlacement(obj.AttachmentOffset, offset):
+            obj.AttachmentOffset = offset
+            moved.append(obj)
 
 
 """
@@ -551,31 +713,35 @@ def getConfigDescription(conf):
     return str(conf.get(DESCRIPTION_CELL)).strip()
 
 
-def GetValidAlias(str):
-    # Spreadsheed doesn't like many characters in the alias, specifically the '.' that we need to separate sub-sub-links
-    # For now we will just remove all those characters in hope that there will be no duplication
-    badChars = '`~!@#$%^&*()-+=|\;:\'".,'
-    ret = ''
-    for char in str:
-        if char not in badChars:
-            ret = ret + char
-    # Should not have '_' at the beginning of the string...
-    ret = ret.strip('_')
-    return ret
+# store configurations as JSON instead of spreadsheet rows
+def isJSON():
+    return App.ParamGet(Asm4.paramPath).GetBool('ConfigurationsAsJSON', False)
 
 
-def GetObjectRow(conf, name):
-    cell = conf.getCellFromAlias(GetValidAlias(name))
-    if cell:
-        # leave only numbers in the cell string
-        row = ''.join(i for i in cell if i.isdigit())
-        return row
-    return None
+# the name of an object in a configuration: parent.subObject
+def getObjectName(obj):
+    parentObj, objFullName = obj.Parents[0]
+    #objName = App.ActiveDocument.Name + '.' + parentObj.Name + '.' + objFullName
+    return parentObj.Name + '.' + objFullName.rstrip('.')
 
 
-def GetObjectData(conf, name, col):
-    row = GetObjectRow(conf, name)
-    return conf.get(str(col) + str(row))
+# compare 2 placements, q and -q are the same rotation
+# 1-|q1.q2| is about angle²/8, hence the squared tolerance
+def isSamePlacement(a, b, tol=1e-6):
+    if (a.Base - b.Base).Length > tol:
+        return False
+    dot = sum( x*y for x, y in zip(a.Rotation.Q, b.Rotation.Q) )
+    return 1.0 - abs(dot) <= tol*tol
+
+
+# the value of a spreadsheet cell, or None if the cell is empty
+def getCellValue(conf, cell):
+    if not conf.getContents(cell):
+        return None
+    try:
+        return conf.get(cell)
+    except ValueError:
+        return None
 
 
 class ListEntry(QtGui.QListWidgetItem):
@@ -52,13 +52,8 @@ file.close()
     |                  The Help Tools               |
     +-----------------------------------------------+
 """
-def writeXml(text):
-    text=text.encode('unicode_escape').decode().replace('\\','_x_m_l_')
-    return text
-
-def decodeXml(text):
-    text=text.replace('_x_m_l_','\\').encode().decode('unicode_escape')
-    return text
+# they are in InfoKeys.py, which doesn't need the GUI
+from InfoKeys import writeXml, decodeXml
 
 """
     +-----------------------------------------------+
@@ -129,19 +124,13 @@ class infoPartUI():
                                 self.infoTable.append([prop,value])
 
     # add the default part information
+    # object is an App::Part, or an object with a part (like this UI)
     def makePartInfo( self, object , reset=False ):
-        for info in self.infoKeysUser:
-            if self.infoKeysUser.get(info).get('active'):
-                try :
-                    object.part
-                    if not hasattr(object.part,self.infoKeysUser.get(info).get('userData')):
-                        #object with part
-                        object.part.addProperty( 'App::PropertyString', self.infoKeysUser.get(info).get('userData'), 'PartInfo' )
-                except AttributeError :
-                    if object.TypeId == 'App::Part' :
-                        #object part
-                        if not hasattr(object,self.infoKeysUser.get(info).get('userData')):
-                            object.addProperty( 'App::PropertyString', self.infoKeysUser.get(info).get('userData'), 'PartInfo' )    
+        part = getattr(object, 'part', None)
+        if part is None and object.TypeId == 'App::Part':
+            part = object
+        if part is not None:
+            InfoKeys.makePartInfo( part, self.infoKeysUser )
         return
     
     # AddNew
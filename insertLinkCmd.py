@@ -303,6 +303,9 @@ class insertLink():
                 # if it has been renamed, we take the name given by the user
                 if part.Name == part.Label:
                     proposedLinkName = part.Document.Name
+            # if the part is already linked in this document, we take the next instance
+            if Asm4.findObjectLinks(part, self.activeDoc):
+                proposedLinkName = Asm4.nextInstance(proposedLinkName)
             # set the proposed name into the text field, unless it's a broken link
             if not self.brokenLink:
                 self.linkNameInput.setText( proposedLinkName )
@@ -8,45 +8,13 @@
 
 
 import os
-import json
 
 from PySide import QtGui, QtCore
 import FreeCADGui as Gui
 import FreeCAD as App
 
 import Asm4_libs as Asm4
-import infoPartCmd
-import InfoKeys
-
-# protection against update of user configuration
-
-### to have the dir of external configuration file
-ConfUserDir = os.path.join(App.getUserAppDataDir(),'Templates')
-ConfUserFilename = "Asm4_infoPartConf.json"
-ConfUserFilejson = os.path.join(ConfUserDir, ConfUserFilename)
-
-
-### try to open existing external configuration file of user
-try :
-    file = open(ConfUserFilejson, 'r')
-    file.close()
-### else make the default external configuration file
-except :
-    partInfoDef = dict()
-    for prop in InfoKeys.partInfo:
-        partInfoDef.setdefault(prop,{'userData':prop + 'User','active':True})
-    os.mkdir(ConfUserDir)
-    file = open(ConfUserFilejson, 'x')
-    json.dump(partInfoDef,file)
-    file.close()
-    
-### now user configuration is :
-file = open(ConfUserFilejson, 'r')
-infoKeysUser = json.load(file).copy()
-file.close()
-    
-crea = infoPartCmd.infoPartUI.makePartInfo
-fill = infoPartCmd.infoPartUI.infoDefault
+import Asm4_bom
 
 
 
@@ -67,9 +35,6 @@ fill = infoPartCmd.infoPartUI.infoDefault
 class makeBOM:
     def __init__(self):
         super(makeBOM,self).__init__()
-        file = open(ConfUserFilejson, 'r')
-        self.infoKeysUser = json.load(file).copy()
-        file.close()
 
     def GetResources(self):
         tooltip  = "Bill of Materials"
@@ -103,62 +68,49 @@ class makeBOM:
         self.UI.show()
         self.BOM.clear()
         self.Verbose=str()
-        self.PartsList = {}
+        self.PartsList = []
+        self.engine = None
         self.listParts(self.model)
+        self.unusedParts(self.model)
         self.inSpreadsheet()
         self.BOM.setPlainText(self.Verbose)
 
+### def unusedParts: the parts of the document that are linked nowhere are not in the BOM
+
+    def unusedParts(self,object):
+        if object == None:
+            return
+        for part in self.modelDoc.findObjects('App::Part'):
+            if part != object and part.getParentGeoFeatureGroup() is None:
+                if not Asm4.findObjectLinks(part, self.modelDoc):
+                    self.Verbose+='this Part is not used in the Assembly :'+ part.Label +'\n'
+        return
+
 ### def listParts use of Part info Edit
+### the traversal is done by the BOM engine in Asm4_bom.py
 
-    def listParts(self,object,level=0):
-        file = open(ConfUserFilejson, 'r')
-        self.infoKeysUser = json.load(file).copy()
-        file.close()
+    def listParts(self,object):
         if object == None:
             return
-        if self.PartsList == None:
-            self.PartsList = {}
-        # research App::Part because the partInfo attribute is on
-        if object.TypeId=='App::Link':
-            self.listParts(object.LinkedObject,level+1)
+        # the engine reads the user configuration once for the whole BOM
+        # and is kept to switch between the flat and the multi-level BOM
+        if self.engine is None:
+            self.engine = Asm4_bom.bomEngine()
+        if self.MultiLevel.isChecked():
+            self.PartsList = list(self.engine.indentedRows(object))
         else:
-            if object.TypeId=='App::Part':
-                if level > 0:
-                    # write PartsList
-                    # test if the part already exist on PartsList
-                    if object.Label in self.PartsList:
-                        # if already exist =+ 1 in qty of this part count
-                        self.PartsList[object.Label]['Qty.'] = self.PartsList[object.Label]['Qty.'] + 1
-                    else:
-                        # if not exist , create a dict() for this part
-                        self.PartsList[object.Label] = dict()
-                        for prop in self.infoKeysUser:
-                            if self.infoKeysUser.get(prop).get('active'):
-                                try:
-                                    # try to get partInfo in part
-                                    getattr(object,self.infoKeysUser.get(prop).get('userData'))
-                                except AttributeError:
-                                    self.Verbose+='you don\'t have fill the info of this Part :'+ object.Label +'\n'
-                                    crea(self,object)
-                                    self.Verbose+='info create for :'+ object.Label +'\n'
-                                    fill(object)
-                                    self.Verbose+='info auto filled for :'+ object.Label+'\n'
-                                self.PartsList[object.Label][self.infoKeysUser.get(prop).get('userData')] = getattr(object,self.infoKeysUser.get(prop).get('userData'))
-                        self.PartsList[object.Label]['Qty.'] = 1
-                # look for sub-objects
-                for objname in object.getSubObjects():
-                    subobj = object.Document.getObject( objname[0:-1] )
-                    self.listParts(subobj,level+1)
-
-        return
+            self.PartsList = list(self.engine.rows(object))
+        self.Verbose+=self.engine.Verbose
+        self.engine.Verbose=str()
         self.Verbose+='Your Bill of Materials is Done\n'
+        return
 
 ### def Copy - Copy on Spreadsheet
 
     def inSpreadsheet(self):
         # Copies Parts List to Spreadsheet
         document = App.ActiveDocument
-        # init plist with dict() PartsList
+        # init plist with the list of rows PartsList
         plist = self.PartsList
         if len(plist) == 0:
             return
@@ -169,28 +121,35 @@ class makeBOM:
             spreadsheet = document.BOM
 
         spreadsheet.Label = "BOM"
-        # clean the BOM
-        spreadsheet.clearAll()
-        # to write line in spreadsheet
-        def wrow(drow: [str], row: int):
-            for i, d in enumerate(drow):
-                if row==0:
-                    spreadsheet.set(str(chr(ord('a') + i)).upper()+str(row+1),infoPartCmd.decodeXml(str(d)))
-                else :
-                    spreadsheet.set(str(chr(ord('a') + i)).upper()+str(row+1),str(d))
-        # to make list of values of dict() plist
-        data = list(plist.values())
-        # to write first line with keys
-        wrow(data[0].keys(),0)
-        # to write line by line BoM in Spreadsheet
-        for i,_ in enumerate(data):
-            wrow(data[i].values(),i+1)
+        # clean the BOM and write all the lines at once
+        Asm4.writeSheet( spreadsheet, Asm4_bom.bomTable(plist) )
         
         document.recompute()
 
         self.Verbose+='Your Bill of Materials is Write on BOM Spreadsheet\n'
 
 
+    # switch between the flat and the multi-level BOM
+    def onMultiLevel(self):
+        self.listParts(self.model)
+        self.inSpreadsheet()
+        self.BOM.setPlainText(self.Verbose)
+
+
+    # write the BOM in a CSV or Excel file, without the spreadsheet
+    def onExport(self):
+        if len(self.PartsList) == 0:
+            return
+        fileName = QtGui.QFileDialog.getSaveFileName( self.UI, 'Export BOM', 'BOM.csv',
+                        'CSV files (*.csv);;Excel files (*.xlsx);;TSV files (*.tsv)' )[0]
+        if fileName:
+            if Asm4_bom.writeFile( fileName, Asm4_bom.bomTable(self.PartsList) ):
+                self.Verbose+='Your Bill of Materials is Write on '+fileName+'\n'
+            else:
+                self.Verbose+='Could not write '+fileName+'\n'
+            self.BOM.setPlainText(self.Verbose)
+
+
     def onOK(self):
         document = App.ActiveDocument
         Gui.Selection.addSelection(document.Name,'BOM')
@@ -232,6 +191,17 @@ class makeBOM:
         # the button row definition
         self.buttonLayout = QtGui.QHBoxLayout()
         
+        # Multi-level BOM checkbox
+        self.MultiLevel = QtGui.QCheckBox('Multi-level')
+        self.MultiLevel.setToolTip('Show the sub-assemblies with their parts, with the quantities per level and in total')
+        self.buttonLayout.addWidget(self.MultiLevel)
+
+        # Export button
+        self.ExportButton = QtGui.QPushButton('Export')
+        self.ExportButton.setToolTip('Export the BOM to a CSV or Excel file')
+        self.buttonLayout.addWidget(self.ExportButton)
+        self.buttonLayout.addStretch()
+
         # OK button
         self.OkButton = QtGui.QPushButton('OK')
         self.OkButton.setDefault(True)
@@ -242,6 +212,8 @@ class makeBOM:
         self.UI.setLayout(self.mainLayout)
 
         # Actions
+        self.MultiLevel.toggled.connect(self.onMultiLevel)
+        self.ExportButton.clicked.connect(self.onExport)
         self.OkButton.clicked.connect(self.onOK)
 
 # add the command to the workbench
@@ -66,7 +66,7 @@ class placeLinkCmd():
             parent = selection.getParentGeoFeatureGroup()
             if parent and parent == Asm4.getAssembly():
                 # if it's a valid assembly and part
-                if Asm4.isAsm4EE(selection):
+                if Asm4.isAsm4EE(selection) or Asm4.isAsm4Native(selection):
                     # launch the UI in the task panel
                     ui = placeLinkUI()
                     Gui.Control.showDialog(ui)
@@ -12,6 +12,7 @@ import FreeCAD as App
 from FreeCAD import Console as FCC
 
 import Asm4_libs as Asm4
+import Asm4_solver
 from placePartUI import placePartUI
 import selectionFilter
 
@@ -58,7 +59,7 @@ class placeLinkUI():
         self.rootAssembly = Asm4.getAssembly()
 
         # has been checked before, this is for security only
-        if Asm4.isAsm4EE(self.selectedObj):
+        if Asm4.isAsm4EE(self.selectedObj) or Asm4.isAsm4Native(self.selectedObj):
             # get the old values
             self.old_AO = self.selectedObj.AttachmentOffset
             self.old_linkLCS = self.selectedObj.AttachedBy[1:]
@@ -119,6 +120,12 @@ class placeLinkUI():
         # if the decode is unsuccessful, old_Expression is set to False and the other things are set to 'None'
         (self.old_Parent, separator, self.old_parentLCS) = self.selectedObj.AttachedTo.partition('#')
         ( old_Parent, old_attLCS, old_linkLCS ) = self.splitExpressionLink( self.old_EE, self.old_Parent )
+        # the native solver has no expression, the attachments are in the properties
+        self.old_SolverId   = self.selectedObj.SolverId
+        self.old_AttachedTo = self.selectedObj.AttachedTo
+        self.old_AttachedBy = self.selectedObj.AttachedBy
+        if Asm4.isAsm4Native(self.selectedObj):
+            ( old_Parent, old_attLCS, old_linkLCS ) = ( self.old_Parent, self.old_parentLCS, self.old_linkLCS )
         # sometimes, the object is in << >> which is an error by FreeCAD,
         # because that's reserved for labels, but we still look for it
         if len(old_attLCS)>4 and old_attLCS[:2]=='<<' and old_attLCS[-2:]=='>>':
@@ -240,6 +247,13 @@ class placeLinkUI():
             self.selectedObj.AttachmentOffset = self.old_AO
         if self.old_EE:
             self.selectedObj.setExpression( 'Placement', self.old_EE )
+        # Apply might have changed the solver
+        if self.selectedObj.SolverId != self.old_SolverId or Asm4.isAsm4Native(self.selectedObj):
+            self.selectedObj.SolverId   = self.old_SolverId
+            self.selectedObj.AttachedTo = self.old_AttachedTo
+            self.selectedObj.AttachedBy = self.old_AttachedBy
+            if Asm4.isAsm4Native(self.selectedObj):
+                Asm4_solver.solveNative(self.selectedObj)
         self.selectedObj.recompute()
         # highlight in the 3D window the object we placed
         self.finish()
@@ -320,6 +334,11 @@ class placeLinkUI():
             # self.selectedObj.AssemblyType = 'Part::Link'
             self.selectedObj.AttachedBy = '#'+l_LCS
             self.selectedObj.AttachedTo = a_Link+'#'+a_LCS
+            # the native solver computes the Placement directly from the above properties
+            if Asm4_solver.isNative() or Asm4.isAsm4Native(self.selectedObj):
+                Asm4_solver.setNativeSolver(self.selectedObj)
+                self.rootAssembly.recompute(True)
+                return True
             self.selectedObj.SolverId = 'Placement::ExpressionEngine'
             # build the expression for the ExpressionEngine
             # this is where all the magic is, see:
@@ -493,6 +512,9 @@ class placeLinkUI():
         rotationY = App.Placement( App.Vector(0.00, 0.00, 0.00), App.Rotation( App.Vector(0,1,0), self.YrotationAngle - self.old_LinkRotation.toEuler()[1] ))
         rotationZ = App.Placement( App.Vector(0.00, 0.00, 0.00), App.Rotation( App.Vector(0,0,1), self.ZrotationAngle - self.old_LinkRotation.toEuler()[2] ))
         self.selectedObj.AttachmentOffset = moveXYZ * rotationX * rotationY * rotationZ
+        # the native solver doesn't use the Placement expression
+        if Asm4.isAsm4Native(self.selectedObj):
+            Asm4_solver.solveNative(self.selectedObj)
         self.selectedObj.recompute()
 
     def onXTranslValChanged(self):
@@ -51,7 +51,7 @@ class releaseAttachment:
         if Asm4.getAssembly() and len(Gui.Selection.getSelection())==1:
             # set the (first) selected object as global variable
             selection = Gui.Selection.getSelection()[0]
-            if Asm4.isAsm4EE(selection) and selection.SolverId != '':
+            if (Asm4.isAsm4EE(selection) or Asm4.isAsm4Native(selection)) and selection.SolverId != '':
                 selectedObj = selection
         # now we should be safe
         return selectedObj
@@ -9,9 +9,11 @@ import math, re, os
 from PySide import QtGui, QtCore
 import FreeCADGui as Gui
 import FreeCAD as App
+from FreeCAD import Console as FCC
 import Part
 
 import Asm4_libs as Asm4
+import Asm4_solver
 
 
 
@@ -36,11 +38,15 @@ class updateAssembly:
     +-----------------------------------------------+
     """
     def Activated(self):
-        # find every Part in the document ...
-        for obj in App.ActiveDocument.Objects:
-            # ... and update it
-            if obj.TypeId == 'App::Part':
-                obj.recompute('True')
+        doc = App.ActiveDocument
+        # only recompute what has changed since the last solve ...
+        if Asm4_solver.isIncremental() and Asm4_solver.tracker.isTracked(doc):
+            nbSolved = Asm4_solver.solveIncremental(doc)
+            if nbSolved is not None:
+                FCC.PrintMessage('Incremental solve: '+str(nbSolved)+' objects updated\n')
+        # ... else find every Part in the document and update it
+        else:
+            Asm4_solver.solveFull(doc)
         #App.ActiveDocument.recompute()
 
 